@@ -37,6 +37,7 @@ from aiocqhttp import CQHttp
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 import yobot
+from ybplugins.perf import tracing
 
 
 def main():
@@ -79,6 +80,8 @@ def main():
 
     cqbot = CQHttp(access_token=token,
                    enable_http_post=False)
+    # 记录每次api调用的耗时
+    cqbot._api = tracing.Traced_api(cqbot._api)
     sche = AsyncIOScheduler()
     bot = yobot.Yobot(data_path=basedir,
                       scheduler=sche,
@@ -90,14 +93,19 @@ def main():
 
     @cqbot.on_message
     async def handle_msg(context):
+        trace = tracing.begin(context)
         if context["message_type"] == "group" or context["message_type"] == "private":
-            reply = await bot.proc_async(context)
+            with tracing.span('proc_async'):
+                reply = await bot.proc_async(context)
         else:
             reply = None
         if isinstance(reply, str) and reply != "":
+            tracing.finish(trace, reply_pending=True,
+                           message_id=context.get('message_id'))
             return {'reply': reply,
                     'at_sender': False}
         else:
+            tracing.finish(trace)
             return None
 
     async def send_it(func):
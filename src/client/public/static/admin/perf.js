@@ -0,0 +1,120 @@
+var vm = new Vue({
+    el: '#app',
+    data: {
+        activeTab: 'queries',
+        querySummary: [],
+        slowQueries: [],
+        loopLag: {
+            samples: 0,
+            max_lag_ms: 0,
+            histogram: [],
+            offenders: [],
+            offender_summary: [],
+        },
+        traces: {
+            total: 0,
+            threshold_ms: 0,
+            slow_traces: [],
+        },
+        traceFilter: '',
+        profileSeconds: 10,
+        profileThread: 'loop',
+        profiling: false,
+        profileResult: '',
+        profileTop: [],
+    },
+    computed: {
+        filteredTraces: function () {
+            var keyword = this.traceFilter.trim();
+            if (!keyword) {
+                return this.traces.slow_traces;
+            }
+            return this.traces.slow_traces.filter(function (trace) {
+                return (trace.id == keyword
+                    || String(trace.context.group_id) == keyword
+                    || String(trace.context.user_id) == keyword
+                    || trace.context.message.indexOf(keyword) != -1);
+            });
+        },
+    },
+    mounted() {
+        this.refresh();
+    },
+    methods: {
+        refresh: function (event) {
+            var thisvue = this;
+            axios.post(api_path, {
+                action: 'get_data',
+                csrf_token: csrf_token,
+            }).then(function (res) {
+                if (res.data.code == 0) {
+                    thisvue.querySummary = res.data.query_summary;
+                    thisvue.slowQueries = res.data.slow_queries;
+                    thisvue.loopLag = res.data.loop_lag;
+                    thisvue.traces = res.data.traces;
+                } else {
+                    thisvue.$alert(res.data.message, '加载数据错误');
+                }
+            }).catch(function (error) {
+                thisvue.$alert(error, '加载数据错误');
+            });
+        },
+        profile: function (event) {
+            var thisvue = this;
+            thisvue.profiling = true;
+            axios.post(profile_path, {
+                seconds: thisvue.profileSeconds,
+                thread: thisvue.profileThread,
+                csrf_token: csrf_token,
+            }, {
+                responseType: 'text',
+            }).then(function (res) {
+                thisvue.profiling = false;
+                if (typeof res.data == 'object') {
+                    thisvue.$alert(res.data.message, '采样失败');
+                    return;
+                }
+                thisvue.profileResult = res.data;
+                thisvue.profileTop = thisvue.summarizeProfile(res.data);
+            }).catch(function (error) {
+                thisvue.profiling = false;
+                thisvue.$alert(error, '采样失败');
+            });
+        },
+        summarizeProfile: function (text) {
+            var functions = {};
+            text.split('\n').forEach(function (line) {
+                var pos = line.lastIndexOf(' ');
+                if (pos == -1) {
+                    return;
+                }
+                var count = parseInt(line.substring(pos + 1));
+                // 第一帧为线程名
+                var frames = line.substring(0, pos).split(';').slice(1);
+                var seen = {};
+                frames.forEach(function (name, index) {
+                    if (!functions[name]) {
+                        functions[name] = { name: name, self: 0, total: 0 };
+                    }
+                    if (!seen[name]) {
+                        seen[name] = true;
+                        functions[name].total += count;
+                    }
+                    if (index == frames.length - 1) {
+                        functions[name].self += count;
+                    }
+                });
+            });
+            return Object.values(functions).sort(function (a, b) {
+                return b.self - a.self;
+            }).slice(0, 50);
+        },
+        downloadProfile: function (event) {
+            var link = document.createElement('a');
+            link.href = URL.createObjectURL(new Blob([this.profileResult], { type: 'text/plain' }));
+            link.download = 'yobot-profile.txt';
+            link.click();
+        },
+    },
+    delimiters: ['[[', ']]'],
+})
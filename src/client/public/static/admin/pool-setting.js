@@ -32,7 +32,7 @@ var vm = new Vue({
                 csrf_token: csrf_token,
             }).then(function (res) {
                 if (res.data.code == 0) {
-                    alert('设置成功，重启后生效');
+                    alert('设置成功');
                 } else {
                     alert('设置失败：' + res.data.message);
                 }
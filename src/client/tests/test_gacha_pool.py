@@ -0,0 +1,137 @@
+"""
+卡池编译与抽卡
+
+使用固定的随机数种子，检查别名表抽到各角色的频率与卡池权重一致：
+
+    cd src/client
+    python -m pytest tests
+"""
+import collections
+import copy
+import random
+
+import pytest
+
+from ybplugins import gacha_pool
+from ybplugins.gacha_pool import Alias_table, compile_pool
+from ybplugins.yobot_exceptions import CodingError
+
+_pool = {
+    'settings': {'combo': 10, 'shuffle': False, 'day_limit': 0},
+    'pool': {
+        'ssr': {'prop': 25, 'prop_last': 25, 'prefix': '★★★',
+                'pool': ['a', 'b']},
+        'sr': {'prop': 180, 'prop_last': 975, 'prefix': '★★',
+               'pool': ['c', 'd', 'e']},
+        'r': {'prop': 795, 'prop_last': 0, 'prefix': '★',
+              'pool': ['f', 'g', 'h', 'i']},
+    },
+}
+
+
+def _expected(pool, key):
+    # 每个角色的概率 = 组概率 / 组内角色数
+    total = sum(g[key] for g in pool['pool'].values())
+    return {
+        g.get('prefix', '') + c: g[key] / total / len(g['pool'])
+        for g in pool['pool'].values() if g[key] > 0
+        for c in g['pool']
+    }
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def backend(request, monkeypatch):
+    if request.param == 'numpy':
+        if gacha_pool.numpy is None:
+            pytest.skip('没有安装numpy')
+        gacha_pool.numpy.random.seed(0)
+    else:
+        monkeypatch.setattr(gacha_pool, 'numpy', None)
+    random.seed(0)
+    return request.param
+
+
+def test_alias_table_frequency():
+    weights = [1, 2, 3, 4, 0, 10]
+    table = Alias_table(weights)
+    rand = random.Random(0).random
+    n = 200000
+    counts = collections.Counter(table.sample(rand) for _ in range(n))
+    for i, w in enumerate(weights):
+        assert counts[i] / n == pytest.approx(w / sum(weights), abs=0.005)
+
+
+def test_result_frequency():
+    compiled = compile_pool(_pool)
+    rand = random.Random(0).random
+    times = 20000
+    normal = collections.Counter()
+    last = collections.Counter()
+    for _ in range(times):
+        result = compiled.result(rand)
+        normal.update(result[:-1])
+        last[result[-1]] += 1
+    for counter, n, key in ((normal, times * 9, 'prop'),
+                            (last, times, 'prop_last')):
+        expected = _expected(_pool, key)
+        assert set(counter) <= set(expected)
+        for char, p in expected.items():
+            assert counter[char] / n == pytest.approx(p, abs=0.01)
+
+
+def test_ssr_prop():
+    compiled = compile_pool(_pool)
+    assert compiled.ssr == {'★★★a', '★★★b'}
+    assert compiled.ssr_prop == pytest.approx(0.025)
+    assert compiled.ssr_prop_last == pytest.approx(0.025)
+
+
+def test_draw_batch(backend):
+    compiled = compile_pool(_pool)
+    times = 2000
+    counter, ssr = compiled.draw_batch(times)
+    assert sum(counter.values()) == times * compiled.combo
+    assert all(c in compiled.ssr for c in ssr)
+    assert len(ssr) == sum(counter[c] for c in compiled.ssr)
+    # 最后一发没有r
+    assert sum(counter[c] for c in counter if c.startswith('★')
+               and not c.startswith('★★')) <= times * (compiled.combo - 1)
+    assert len(ssr) / (times * compiled.combo) == pytest.approx(0.025, abs=0.01)
+
+
+def test_combo_one(backend):
+    pool = copy.deepcopy(_pool)
+    pool['settings']['combo'] = 1
+    compiled = compile_pool(pool)
+    result = compiled.result(random.Random(0).random)
+    assert len(result) == 1 and result[0] in _expected(pool, 'prop_last')
+    counter, _ = compiled.draw_batch(100)
+    assert sum(counter.values()) == 100
+    assert set(counter) <= set(_expected(pool, 'prop_last'))
+    assert len(compiled.simulate_wells(5)) == 5
+
+
+def _modified(change):
+    pool = copy.deepcopy(_pool)
+    change(pool)
+    return pool
+
+
+@pytest.mark.parametrize('pool', [
+    [],
+    {'pool': _pool['pool']},
+    _modified(lambda p: p['settings'].update(combo=0)),
+    _modified(lambda p: p['settings'].update(combo=True)),
+    _modified(lambda p: p['settings'].update(day_limit=-1)),
+    _modified(lambda p: p['settings'].update(shuffle=1)),
+    _modified(lambda p: p.update(pool={})),
+    _modified(lambda p: p['pool']['r'].update(prop=-1)),
+    _modified(lambda p: p['pool']['r'].update(prop_last='0')),
+    _modified(lambda p: p['pool']['r'].update(prefix=1)),
+    _modified(lambda p: p['pool']['r'].update(pool=['f', ''])),
+    _modified(lambda p: [g.update(prop_last=0) for g in p['pool'].values()]),
+    _modified(lambda p: [g.update(prop=0) for g in p['pool'].values()]),
+])
+def test_compile_pool_rejects(pool):
+    with pytest.raises(CodingError):
+        compile_pool(pool)
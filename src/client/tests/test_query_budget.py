@@ -0,0 +1,58 @@
+"""
+公会战核心操作的数据库查询次数
+
+查询次数增加时测试失败，并列出执行的sql：
+
+    cd src/client
+    python -m pytest tests
+"""
+import asyncio
+import json
+import logging
+import os
+
+import pytest
+
+from ybplugins import ybdata
+from ybplugins.clan_battle import ClanBattle
+from ybplugins.perf import query_budget
+from ybplugins.perf.bench_clan_battle import _default_config, seed
+
+_group_id = 100000
+_members = 10
+_battles = 2
+
+
+@pytest.fixture
+def clan(tmp_path):
+    with open(_default_config, encoding='utf-8') as f:
+        setting = json.load(f)
+    setting['dirname'] = str(tmp_path)
+    ybdata.init(os.path.join(str(tmp_path), 'yobotdata.db'))
+    seed(1, _members, 6, _battles)
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    logging.disable(logging.WARNING)
+    try:
+        yield ClanBattle(glo_setting=setting, bot_api=None)
+    finally:
+        logging.disable(logging.NOTSET)
+        ybdata._db.close()
+
+
+def test_challenge_and_undo(clan):
+    # 今天还未出刀的成员
+    qqid = _group_id * 1000 + _members - 1
+    with query_budget.assert_max_queries(11):
+        clan.challenge(_group_id, qqid, False, 1, 1000)
+    with query_budget.assert_max_queries(7):
+        clan.undo(_group_id, qqid)
+
+
+def test_boss_status_summary(clan):
+    with query_budget.assert_max_queries(11):
+        clan.boss_status_summary(_group_id)
+
+
+def test_get_report(clan):
+    with query_budget.assert_max_queries(2):
+        clan.get_report(_group_id, None, nocache=True)
@@ -2,11 +2,11 @@ import datetime
 import json
 import re
 
-import aiohttp
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.date import DateTrigger
 from arrow.arrow import Arrow
 
+from . import http_client
 from .yobot_exceptions import InputError, ServerError
 
 _calender_url = {
@@ -121,7 +121,7 @@ class Event:
 
     async def load_timeline_jp_async(self):
         event_source = "http://toolscdn.yobot.win/calender/jp.json"
-        async with aiohttp.request("GET", url=event_source) as response:
+        async with http_client.request("GET", url=event_source) as response:
             if response.status != 200:
                 raise ServerError(f"服务器状态错误：{response.status}")
             res = await response.text()
@@ -144,7 +144,7 @@ class Event:
 
     async def load_timeline_tw_async(self):
         event_source = "https://pcredivewiki.tw/static/data/event.json"
-        async with aiohttp.request("GET", url=event_source) as response:
+        async with http_client.request("GET", url=event_source) as response:
             if response.status != 200:
                 raise ServerError(f"服务器状态错误：{response.status}")
             res = await response.text()
@@ -167,7 +167,7 @@ class Event:
 
     async def load_timeline_cn_async(self):
         event_source = "http://toolscdn.yobot.win/calender/cn.json"
-        async with aiohttp.request("GET", url=event_source) as response:
+        async with http_client.request("GET", url=event_source) as response:
             if response.status != 200:
                 raise ServerError(f"服务器状态错误：{response.status}")
             res = await response.text()
@@ -13,6 +13,7 @@ from apscheduler.triggers.cron import CronTrigger
 from quart import (Quart, jsonify, make_response, redirect, request, session,
                    url_for)
 
+from ..perf import query_budget
 from ..templating import render_template
 from ..web_util import async_cached_func
 from ..ybdata import (Clan_challenge, Clan_group, Clan_member, Clan_subscribe,Clan_subscribe_new,Clan_subscribe_layv,
@@ -25,6 +26,14 @@ from .util import atqq, pcr_datetime, pcr_timestamp, timed_cached_func
 
 _logger = logging.getLogger(__name__)
 
+# 网页api的操作，用于按操作统计数据库查询
+_api_actions = frozenset((
+    'get_member_list', 'get_data', 'get_challenge', 'get_user_challenge',
+    'update_boss', 'addrecord', 'undo', 'apply', 'cancelapply', 'save_slot',
+    'get_subscribers', 'addsubscribe', 'cancelsubscribe', 'modify',
+    'send_remind', 'drop_member',
+))
+
 
 class ClanBattle:
     Passive = True
@@ -1211,28 +1220,32 @@ class ClanBattle:
             group.c_health,group.c_issecond = self._get_group_previous_challenge_layv(group,boss_num = 3)
             group.d_health,group.d_issecond = self._get_group_previous_challenge_layv(group,boss_num = 4)
             group.e_health,group.e_issecond = self._get_group_previous_challenge_layv(group,boss_num = 5)
+            bosshealth = self.bossinfo[group.game_server][
+                self._level_by_cycle(group.boss_cycle, game_server=group.game_server)]
             if group.a_health == None or (group.a_health==0 and group.a_issecond==False):
-                group.a_health = self.bossinfo[group.game_server][group.boss_cycle][0]
+                group.a_health = bosshealth[0]
                 group.a_issecond = True if group.a_health==0 else False
             if group.b_health == None or (group.b_health==0 and group.b_issecond==False):
-                group.b_health = self.bossinfo[group.game_server][group.boss_cycle][1]
+                group.b_health = bosshealth[1]
                 group.b_issecond = True if group.b_health==0 else False
             if group.c_health == None or (group.c_health==0 and group.c_issecond==False):
-                group.c_health = self.bossinfo[group.game_server][group.boss_cycle][2]
+                group.c_health = bosshealth[2]
                 group.c_issecond = True if group.c_health==0 else False
             if group.d_health == None or (group.d_health==0 and group.d_issecond==False):
-                group.d_health = self.bossinfo[group.game_server][group.boss_cycle][3]
+                group.d_health = bosshealth[3]
                 group.d_issecond = True if group.d_health==0 else False
             if group.e_health == None or (group.e_health==0 and group.e_issecond==False):
-                group.e_health = self.bossinfo[group.game_server][group.boss_cycle][4]
+                group.e_health = bosshealth[4]
                 group.e_issecond = True if group.e_health==0 else False
             if group.a_health == group.b_health == group.c_health == group.d_health == group.e_health == 0:
                 group.boss_cycle += 1
-                group.a_health = self.bossinfo[group.game_server][group.boss_cycle][0]
-                group.b_health = self.bossinfo[group.game_server][group.boss_cycle][1]
-                group.c_health = self.bossinfo[group.game_server][group.boss_cycle][2]
-                group.d_health = self.bossinfo[group.game_server][group.boss_cycle][3]
-                group.e_health = self.bossinfo[group.game_server][group.boss_cycle][4]
+                bosshealth = self.bossinfo[group.game_server][
+                    self._level_by_cycle(group.boss_cycle, game_server=group.game_server)]
+                group.a_health = bosshealth[0]
+                group.b_health = bosshealth[1]
+                group.c_health = bosshealth[2]
+                group.d_health = bosshealth[3]
+                group.e_health = bosshealth[4]
         group.challenging_member_qq_id = None
         group.save()
         Clan_subscribe.delete().where(
@@ -2777,6 +2790,9 @@ class ClanBattle:
                         message='Invalid csrf_token',
                     )
                 action = payload['action']
+                if action in _api_actions:
+                    # 只使用已知的操作名，避免统计表无限增长
+                    query_budget.set_name('yobot_clan_api:'+action)
                 if user_id == 0:
                     # 允许游客查看
                     if action not in ['get_member_list', 'get_challenge']:
@@ -0,0 +1,38 @@
+"""
+资讯源的抓取进度
+
+保存每个 RSS 源和爬虫上次看到的条目编号和条件请求校验值，
+重启后从上次的位置继续，停机期间发布的资讯也会推送
+"""
+import json
+import time
+from typing import Any, Optional, Tuple
+
+from .http_client import Validators
+from .ybdata import Feed_cursor
+
+
+def load(source: str) -> Tuple[Optional[Any], Validators]:
+    """
+    返回 (上次看到的条目编号, 校验值)，没有记录时编号为 None
+    """
+    validators = Validators()
+    row = Feed_cursor.get_or_none(source=source)
+    if row is None:
+        return None, validators
+    validators.etag = row.etag
+    validators.last_modified = row.last_modified
+    validators.length = row.length
+    last_id = None if row.last_id is None else json.loads(row.last_id)
+    return last_id, validators
+
+
+def save(source: str, last_id: Any, validators: Validators) -> None:
+    Feed_cursor.replace(
+        source=source,
+        last_id=None if last_id is None else json.dumps(last_id),
+        etag=validators.etag,
+        last_modified=validators.last_modified,
+        length=validators.length,
+        update_time=int(time.time()),
+    ).execute()
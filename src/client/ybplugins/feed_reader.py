@@ -0,0 +1,123 @@
+"""
+RSS / Atom 增量解析
+
+按顺序流式解析订阅中的条目，遇到上次看到的条目就停止，
+不解析剩下的内容。条目与 feedparser 的结果使用相同的键（title、link、id、summary、
+published、published_parsed 等），无法处理的订阅抛出 ValueError，由调用者改用 feedparser
+"""
+import datetime
+import string
+import time
+import xml.etree.ElementTree as ET
+from email.utils import parsedate_to_datetime
+from typing import Iterable, List, Optional
+
+from feedparser import FeedParserDict
+
+_atom = '{http://www.w3.org/2005/Atom}'
+_chunk_size = 16384
+
+
+def pattern_fields(pattern: str) -> List[str]:
+    """
+    格式字符串中用到的条目键
+    """
+    fields = []
+    for _, field, _, _ in string.Formatter().parse(pattern):
+        if field:
+            fields.append(field.split('.', 1)[0].split('[', 1)[0])
+    return fields
+
+
+def _text(elem: Optional[ET.Element]) -> Optional[str]:
+    if elem is None or elem.text is None:
+        return None
+    return elem.text.strip()
+
+
+def _parse_time(value: Optional[str], atom: bool) -> Optional[time.struct_time]:
+    if not value:
+        return None
+    try:
+        if atom:
+            parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+        else:
+            parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return time.gmtime(parsed.timestamp())
+
+
+def _rss_entry(item: ET.Element) -> FeedParserDict:
+    entry = FeedParserDict()
+    for key, tag in (('title', 'title'), ('link', 'link'), ('id', 'guid'),
+                     ('summary', 'description'), ('published', 'pubDate'),
+                     ('author', 'author')):
+        value = _text(item.find(tag))
+        if value is not None:
+            entry[key] = value
+    published = _parse_time(entry.get('published'), atom=False)
+    if published is not None:
+        entry['published_parsed'] = published
+    return entry
+
+
+def _atom_entry(item: ET.Element) -> FeedParserDict:
+    entry = FeedParserDict()
+    for key, tag in (('title', 'title'), ('id', 'id'),
+                     ('summary', 'summary'), ('published', 'published'),
+                     ('updated', 'updated')):
+        value = _text(item.find(_atom + tag))
+        if value is not None:
+            entry[key] = value
+    if 'summary' not in entry:
+        content = _text(item.find(_atom + 'content'))
+        if content is not None:
+            entry['summary'] = content
+    for link in item.findall(_atom + 'link'):
+        if link.get('rel', 'alternate') == 'alternate' and link.get('href'):
+            entry['link'] = link.get('href')
+            break
+    for key in ('published', 'updated'):
+        parsed = _parse_time(entry.get(key), atom=True)
+        if parsed is not None:
+            entry[key + '_parsed'] = parsed
+    return entry
+
+
+def read_entries(text: str, stop_id: Optional[str] = None,
+                 fields: Iterable[str] = ()) -> List[FeedParserDict]:
+    """
+    返回 id 为 stop_id 的条目之前的所有条目（stop_id 为 None 或没有找到时返回全部），
+    订阅格式无法识别、条目没有 id 或缺少 fields 中的键时抛出 ValueError
+    """
+    fields = list(fields)
+    parser = ET.XMLPullParser(events=('end',))
+    entries = []
+    try:
+        for start in range(0, len(text), _chunk_size):
+            parser.feed(text[start:start + _chunk_size])
+            for _, elem in parser.read_events():
+                if elem.tag == 'item':
+                    entry = _rss_entry(elem)
+                elif elem.tag == _atom + 'entry':
+                    entry = _atom_entry(elem)
+                elif elem.tag in ('rss', _atom + 'feed'):
+                    return entries
+                else:
+                    continue
+                elem.clear()
+                if 'id' not in entry:
+                    raise ValueError('条目没有id')
+                if entry['id'] == stop_id:
+                    return entries
+                for field in fields:
+                    if field not in entry:
+                        raise ValueError('条目没有{}'.format(field))
+                entries.append(entry)
+        parser.close()
+    except ET.ParseError as e:
+        raise ValueError('无法解析：{}'.format(e)) from e
+    raise ValueError('无法识别的订阅格式')
@@ -1,31 +1,49 @@
 import asyncio
+import collections
+import io
 import json
 import os
 import pickle
-import random
 import re
 import sqlite3
 import time
-from functools import lru_cache
 from typing import List, Union
 from urllib.parse import urljoin
 
 import requests
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.interval import IntervalTrigger
+from peewee import chunked
 from quart import Quart
 
+from .gacha_pool import Gacha_pool
+from .gacha_store import Gacha_store
+from .page_cache import Page_cache
 from .templating import render_template
+from .ybdata import Gacha_collection, Gacha_user, _db
 from .yobot_exceptions import CodingError, ServerError
 
 
+class _Colle_unpickler(pickle.Unpickler):
+    # 旧版仓库只保存了 {角色名: 数量}，不允许加载任何类
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError('仓库数据中不应包含对象')
+
+
 class Gacha:
     Passive = True
     Active = False
     Request = True
     URL = "http://api.yobot.xyz/3.1.4/pool.json"
+    simulate_limit = 100000
 
-    def __init__(self, glo_setting: dict, bot_api, *args, **kwargs):
+    def __init__(self, glo_setting: dict, bot_api,
+                 scheduler: AsyncIOScheduler = None,
+                 page_cache: Page_cache = None, app: Quart = None,
+                 *args, **kwargs):
         self.setting = glo_setting
         self.bot_api = bot_api
+        self.page_cache = page_cache
         self.pool_file_path = os.path.join(
             self.setting["dirname"], "pool3.json")
         self.pool_checktime = 0
@@ -39,77 +57,91 @@ class Gacha:
                     "bad server response. code: "+str(res.status_code))
             with open(self.pool_file_path, "w", encoding="utf-8") as f:
                 f.write(res.text)
-            self._pool = json.loads(res.text)
-        else:
-            with open(self.pool_file_path, "r", encoding="utf-8") as f:
-                try:
-                    self._pool = json.load(f)
-                except json.JSONDecodeError:
-                    raise CodingError("卡池文件解析错误，请检查卡池文件语法")
+        self.pool = Gacha_pool(self.pool_file_path)
+        self._import_legacy_collections()
+        self.store = Gacha_store()
+        if scheduler is not None:
+            scheduler.add_job(
+                self.flush_async,
+                trigger=IntervalTrigger(
+                    seconds=self.setting.get("gacha_flush_seconds", 5)),
+                misfire_grace_time=60,
+                coalesce=True,
+                max_instances=1,
+            )
+        if app is not None:
+            # 服务停止时（包括收到 SIGTERM）写入未保存的抽卡记录
+            app.after_serving(self.flush_on_shutdown_async)
+
+    async def flush_async(self):
+        self.store.flush()
+
+    async def flush_on_shutdown_async(self):
+        try:
+            self.store.flush()
+        except Exception as e:
+            print('抽卡记录写入失败：{}'.format(e))
+
+    def _import_legacy_collections(self) -> None:
+        """
+        把旧版 collections.db 中的仓库导入主数据库，导入后旧文件改名为 .bak
+        """
+        legacy = os.path.join(self.setting["dirname"], "collections.db")
+        if not os.path.exists(legacy):
+            return
+        db_conn = sqlite3.connect(legacy)
+        try:
+            rows = list(db_conn.execute(
+                "SELECT qqid,colle,times,last_day,day_times FROM Colle"))
+        except sqlite3.DatabaseError:
+            rows = []
+        finally:
+            db_conn.close()
+        users = []
+        colle = []
+        for qqid, blob, times, last_day, day_times in rows:
+            users.append({
+                'qqid': qqid,
+                'times': times or 0,
+                'last_day': last_day or '',
+                'day_times': day_times or 0,
+            })
+            try:
+                info = _Colle_unpickler(io.BytesIO(blob)).load()
+            except (pickle.UnpicklingError, EOFError, TypeError):
+                print('无法读取{}的旧仓库，已跳过'.format(qqid))
+                continue
+            for char, count in info.items():
+                colle.append({'qqid': qqid, 'character': char, 'count': count})
+        with _db.atomic():
+            for batch in chunked(users, 200):
+                Gacha_user.insert_many(batch).on_conflict_ignore().execute()
+            for batch in chunked(colle, 300):
+                Gacha_collection.insert_many(batch).on_conflict_ignore().execute()
+        os.replace(legacy, legacy + ".bak")
+        print('已导入{}个用户的旧仓库'.format(len(users)))
+
+    @property
+    def _pool(self) -> dict:
+        return self.pool.compiled.data
 
     def result(self) -> List[str]:
-        prop = 0.
-        result_list = []
-        for p in self._pool["pool"].values():
-            prop += p["prop"]
-        for i in range(self._pool["settings"]["combo"] - 1):
-            resu = random.random() * prop
-            for p in self._pool["pool"].values():
-                resu -= p["prop"]
-                if resu < 0:
-                    result_list.append(p.get("prefix", "") +
-                                       random.choice(p["pool"]))
-                    break
-        prop = 0.
-        for p in self._pool["pool"].values():
-            prop += p["prop_last"]
-        resu = random.random() * prop
-        for p in self._pool["pool"].values():
-            resu -= p["prop_last"]
-            if resu < 0:
-                result_list.append(p.get("prefix", "") +
-                                   random.choice(p["pool"]))
-                break
-        if self._pool["settings"]["shuffle"]:
-            random.shuffle(result_list)
-        return result_list
+        return self.pool.compiled.result()
 
     def gacha(self, qqid: int, nickname: str) -> str:
         # self.check_ver()  # no more updating
-        db_exists = os.path.exists(os.path.join(
-            self.setting["dirname"], "collections.db"))
-        db_conn = sqlite3.connect(os.path.join(
-            self.setting["dirname"], "collections.db"))
-        db = db_conn.cursor()
-        if not db_exists:
-            db.execute(
-                '''CREATE TABLE Colle(
-                qqid INT PRIMARY KEY,
-                colle BLOB,
-                times SMALLINT,
-                last_day CHARACTER(4),
-                day_times TINYINT)''')
-        today = time.strftime("%m%d")
-        sql_info = list(db.execute(
-            "SELECT colle,times,last_day,day_times FROM Colle WHERE qqid=?", (qqid,)))
-        mem_exists = (len(sql_info) == 1)
-        if mem_exists:
-            info = pickle.loads(sql_info[0][0])
-            times, last_day, day_times = sql_info[0][1:]
-        else:
-            info = {}
-            times, last_day, day_times = 0, "", 0
+        user = self.store.user(qqid)
         day_limit = self._pool["settings"]["day_limit"]
-        if today != last_day:
-            last_day = today
-            day_times = 0
-        if day_limit != 0 and day_times >= day_limit:
-            return "{}今天已经抽了{}次了，明天再来吧".format(nickname, day_times)
+        if day_limit != 0 and user.day_times >= day_limit:
+            return "{}今天已经抽了{}次了，明天再来吧".format(nickname, user.day_times)
         result = self.result()
-        times += 1
-        day_times += 1
+        user.times += 1
+        user.day_times += 1
+        drawn = collections.Counter(result)
+        info = self.store.counts(qqid, drawn)
+        self.store.add(user, drawn)
         reply = ""
-        reply += "{}第{}抽：".format(nickname, times)
+        reply += "{}第{}抽：".format(nickname, user.times)
         for char in result:
             if char in info:
                 info[char] += 1
@@ -117,87 +149,38 @@ class Gacha:
             else:
                 info[char] = 1
                 reply += "\n{}(new)".format(char)
-        sql_info = pickle.dumps(info)
-        if mem_exists:
-            db.execute("UPDATE Colle SET colle=?, times=?, last_day=?, day_times=? WHERE qqid=?",
-                       (sql_info, times, last_day, day_times, qqid))
-        else:
-            db.execute("INSERT INTO Colle (qqid,colle,times,last_day,day_times) VALUES(?,?,?,?,?)",
-                       (qqid, sql_info, times, last_day, day_times))
-        db_conn.commit()
-        db_conn.close()
         return reply
 
-    @lru_cache(maxsize=256)
     def check_ssr(self, char):
-        prop = 0.
-        for p in self._pool["pool"].values():
-            prop += p["prop"]
-        prop = prop*0.05
-        for p in self._pool["pool"].values():
-            chars = [p.get("prefix", "")+x for x in p["pool"]]
-            if char in chars and p["prop"] < prop:
-                return True
-        return False
+        return char in self.pool.compiled.ssr
 
     def thirtytimes(self, qqid: int, nickname: str) -> str:
         # self.check_ver()  # no more updating
-        db_exists = os.path.exists(os.path.join(
-            self.setting["dirname"], "collections.db"))
-        db_conn = sqlite3.connect(os.path.join(
-            self.setting["dirname"], "collections.db"))
-        db = db_conn.cursor()
-        if not db_exists:
-            db.execute(
-                '''CREATE TABLE Colle(
-                qqid INT PRIMARY KEY,
-                colle BLOB,
-                times SMALLINT,
-                last_day CHARACTER(4),
-                day_times TINYINT)''')
-        today = time.strftime("%m%d")
-        sql_info = list(db.execute(
-            "SELECT colle,times,last_day,day_times FROM Colle WHERE qqid=?", (qqid,)))
-        mem_exists = (len(sql_info) == 1)
-        if mem_exists:
-            info = pickle.loads(sql_info[0][0])
-            times, last_day, day_times = sql_info[0][1:]
-        else:
-            info = {}
-            times, last_day, day_times = 0, "", 0
+        user = self.store.user(qqid)
         day_limit = self._pool["settings"]["day_limit"]
-        if today != last_day:
-            last_day = today
-            day_times = 0
-        if day_limit != 0 and day_times+20 > day_limit:
-            return "{}今天剩余抽卡次数不足30次，不能抽一井".format(nickname, day_times)
+        if day_limit != 0 and user.day_times+20 > day_limit:
+            return "{}今天剩余抽卡次数不足30次，不能抽一井".format(nickname, user.day_times)
         reply = ""
         result = ""
         flag_fully_30_times = True
-        for i in range(1, 31):
-            if day_limit != 0 and day_times >= day_limit:
-                reply += "{}抽到第{}发十连时已经达到今日抽卡上限，抽卡结果:".format(nickname, i)
-                flag_fully_30_times = False
-                break
-            single_result = self.result()
-            times += 1
-            day_times += 1
-            for char in single_result:
-                if char in info:
-                    info[char] += 1
-                    if self.check_ssr(char):
-                        result += "\n{}({})".format(char, info[char])
-                else:
-                    info[char] = 1
-                    if self.check_ssr(char):
-                        result += "\n{}(new)".format(char)
-        sql_info = pickle.dumps(info)
-        if mem_exists:
-            db.execute("UPDATE Colle SET colle=?, times=?, last_day=?, day_times=? WHERE qqid=?",
-                       (sql_info, times, last_day, day_times, qqid))
-        else:
-            db.execute("INSERT INTO Colle (qqid,colle,times,last_day,day_times) VALUES(?,?,?,?,?)",
-                       (qqid, sql_info, times, last_day, day_times))
+        draw_times = 30
+        if day_limit != 0 and user.day_times + draw_times > day_limit:
+            draw_times = day_limit - user.day_times
+            reply += "{}抽到第{}发十连时已经达到今日抽卡上限，抽卡结果:".format(
+                nickname, draw_times + 1)
+            flag_fully_30_times = False
+        counts, ssr_hits = self.pool.compiled.draw_batch(draw_times)
+        user.times += draw_times
+        user.day_times += draw_times
+        info = self.store.counts(qqid, set(ssr_hits))
+        self.store.add(user, counts)
+        hit_times = {}
+        for char in ssr_hits:
+            hit_times[char] = hit_times.get(char, info.get(char, 0)) + 1
+            if hit_times[char] == 1:
+                result += "\n{}(new)".format(char)
+            else:
+                result += "\n{}({})".format(char, hit_times[char])
         if not result:
             if flag_fully_30_times:
                 reply += "\n{}太非了，本次下井没有抽到ssr。".format(nickname)
@@ -207,35 +190,44 @@ class Gacha:
         if flag_fully_30_times:
             reply += "{}本次下井结果：".format(nickname)
         reply += result
-        db_conn.commit()
-        db_conn.close()
+        return reply
+
+    def simulate(self, cmd: str) -> str:
+        match = re.match(r"^模拟 *(\d+) *井$", cmd)
+        if not match:
+            return "请输入要模拟的井数，比如【模拟1000井】"
+        wells = int(match.group(1))
+        if not 1 <= wells <= self.simulate_limit:
+            return "模拟的井数需要在1到{}之间".format(self.simulate_limit)
+        compiled = self.pool.compiled
+        ssr_counts = compiled.simulate_wells(wells)
+        distribution = {}
+        for count in ssr_counts:
+            distribution[int(count)] = distribution.get(int(count), 0) + 1
+        total = sum(k * v for k, v in distribution.items())
+        reply = "模拟{}井（{}抽）：\n平均每井{:.2f}个ssr，最多{}个\n没有ssr的井：{:.2%}".format(
+            wells, wells * 30 * compiled.combo, total / wells,
+            max(distribution), distribution.get(0, 0) / wells)
+        for count in sorted(distribution, key=distribution.get,
+                            reverse=True)[:5]:
+            reply += "\n{}个ssr：{:.2%}".format(
+                count, distribution[count] / wells)
         return reply
 
     async def show_colleV2_async(self, qqid, nickname, cmd: Union[None, str] = None) -> str:
-        if not os.path.exists(os.path.join(self.setting["dirname"], "collections.db")):
-            return "没有仓库"
         moreqq_list = []
         if cmd != None:
             pattern = r"(?<=\[CQ:at,qq=)\d+(?=\])"
             moreqq_list = [int(x) for x in re.findall(pattern, cmd)]
-        db_conn = sqlite3.connect(os.path.join(
-            self.setting["dirname"], "collections.db"))
-        db = db_conn.cursor()
-        sql_info = list(db.execute(
-            "SELECT colle FROM Colle WHERE qqid=?", (qqid,)))
-        if len(sql_info) != 1:
-            db_conn.close()
+        colles = self.store.collections([qqid] + moreqq_list)
+        colle = colles[qqid]
+        if not colle:
             return nickname + "的仓库为空"
-        colle = pickle.loads(sql_info[0][0])
         more_colle = []
         for other_qq in moreqq_list:
-            sql_info = list(db.execute(
-                "SELECT colle FROM Colle WHERE qqid=?", (other_qq,)))
-            if len(sql_info) != 1:
-                db_conn.close()
+            if not colles[other_qq]:
                 return "[CQ:at,qq={}] 的仓库为空".format(other_qq)
-            more_colle.append(pickle.loads(sql_info[0][0]))
-        db_conn.close()
+            more_colle.append(colles[other_qq])
         if not os.path.exists(os.path.join(self.setting["dirname"], "temp")):
             os.mkdir(os.path.join(self.setting["dirname"], "temp"))
         showed_colle = set(colle)
@@ -261,16 +253,7 @@ class Gacha:
             data=showdata,
         )
 
-        output_foler = os.path.join(self.setting['dirname'], 'output')
-        num = len(os.listdir(output_foler)) + 1
-        os.mkdir(os.path.join(output_foler, str(num)))
-        filename = 'collection-{}.html'.format(random.randint(0, 999))
-        with open(os.path.join(output_foler, str(num), filename), 'w', encoding='utf-8') as f:
-            f.write(page)
-        reply = urljoin(
-            self.setting['public_address'],
-            '{}output/{}/{}'.format(
-                self.setting['public_basepath'], num, filename))
+        reply = self.page_cache.url(self.setting, self.page_cache.put(page))
         if self.setting['web_mode_hint']:
             reply += '\n\n如果无法打开，请仔细阅读教程中《链接无法打开》的说明'
         return reply
@@ -290,9 +273,11 @@ class Gacha:
                 online_ver = json.loads(res.text)
                 if self._pool["info"]["name"] != online_ver["info"]["name"]:
                     online_ver["settings"] = self._pool["settings"]
-                    self._pool = online_ver
-                    with open(self.pool_file_path, "w", encoding="utf-8") as pf:
-                        pf.write(res.text)
+                    try:
+                        self.pool.save(online_ver)
+                    except CodingError as e:
+                        print("在线卡池有误，未更新：{}".format(e.error_msg))
+                        return
                     print("卡池已自动更新，目前卡池：" + self._pool["info"]["name"])
                 self.pool_checktime = now + 80000
 
@@ -306,6 +291,8 @@ class Gacha:
             return 5
         elif cmd == "抽一井" or cmd == "来一井":
             return 6
+        elif cmd.startswith("模拟") and cmd.endswith("井"):
+            return 7
         else:
             return 0
 
@@ -330,6 +317,8 @@ class Gacha:
             reply = self.thirtytimes(
                 qqid=msg["sender"]["user_id"],
                 nickname=msg["sender"]["card"])
+        elif func_num == 7:
+            reply = self.simulate(msg["raw_message"])
         elif func_num == 4:
             async def show_colle():
                 df_reply = await self.show_colleV2_async(
@@ -0,0 +1,319 @@
+"""
+卡池编译
+
+把 pool3.json 编译为 Walker 别名表（alias method），
+每次抽取只需要一个随机数，耗时与卡池大小无关。
+卡池文件被修改（mtime 变化）后自动重新编译；
+通过 save_pool 修改卡池时先检查并编译，写入文件后立即替换正在使用的卡池
+
+安装了 numpy 时批量抽卡和模拟使用向量化计算，否则使用纯 python
+"""
+import bisect
+import collections
+import json
+import math
+import os
+import random
+import weakref
+from array import array
+from typing import Any, Callable, Dict, List, Sequence, Set, Tuple
+
+from .yobot_exceptions import CodingError
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class Alias_table:
+    """
+    Walker 别名表，按权重在 O(1) 时间内抽取下标
+    """
+
+    def __init__(self, weights: Sequence[float]):
+        n = len(weights)
+        total = float(sum(weights))
+        if n == 0 or total <= 0:
+            raise ValueError('权重之和必须大于0')
+        scaled = [w * n / total for w in weights]
+        self.prob = [1.] * n
+        self.alias = list(range(n))
+        small = [i for i, s in enumerate(scaled) if s < 1]
+        large = [i for i, s in enumerate(scaled) if s >= 1]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] += scaled[s] - 1
+            if scaled[l] < 1:
+                small.append(l)
+            else:
+                large.append(l)
+        # 剩下的都是（浮点误差范围内）概率为1的格子
+        self._n = n
+        if numpy is not None:
+            self._prob_array = numpy.array(self.prob)
+            self._alias_array = numpy.array(self.alias)
+
+    def __len__(self):
+        return self._n
+
+    def sample(self, rand: Callable[[], float] = random.random) -> int:
+        u = rand() * self._n
+        i = int(u)
+        if i >= self._n:
+            i = self._n - 1
+        return i if u - i < self.prob[i] else self.alias[i]
+
+    def sample_many(self, count: int):
+        """
+        抽取 count 次，有 numpy 时返回 numpy 数组，否则返回 array
+        """
+        if numpy is not None:
+            u = numpy.random.random(count) * self._n
+            i = numpy.minimum(u.astype(numpy.intp), self._n - 1)
+            return numpy.where(u - i < self._prob_array[i],
+                               i, self._alias_array[i])
+        return array('l', (self.sample() for _ in range(count)))
+
+
+def _binomial_pmf(n: int, p: float) -> List[float]:
+    return [math.comb(n, k) * p ** k * (1 - p) ** (n - k)
+            for k in range(n + 1)]
+
+
+class Compiled_pool:
+    """
+    一个卡池文件编译后的结果，编译完成后不再修改
+    """
+
+    def __init__(self, pool: Dict[str, Any]):
+        self.data = pool
+        self.combo: int = pool['settings']['combo']
+        self.shuffle: bool = pool['settings']['shuffle']
+        self.chars, self.table = self._compile(pool, 'prop')
+        self.chars_last, self.table_last = self._compile(pool, 'prop_last')
+
+        # 概率低于5%的组视为ssr
+        total = sum(p['prop'] for p in pool['pool'].values())
+        self.ssr: Set[str] = {
+            p.get('prefix', '') + c
+            for p in pool['pool'].values() if p['prop'] < total * 0.05
+            for c in p['pool']
+        }
+
+        # 批量抽卡时两个表的下标合并为一个：最后一发的下标加上 len(chars)
+        self._all_chars = self.chars + self.chars_last
+        self._is_ssr = [c in self.ssr for c in self._all_chars]
+        self.ssr_prop = self._ssr_prop(self.chars, self.table)
+        self.ssr_prop_last = self._ssr_prop(self.chars_last, self.table_last)
+        self._well_cdf: Dict[int, List[float]] = {}
+
+    @staticmethod
+    def _compile(pool: Dict[str, Any], key: str):
+        # 先按组的概率抽组，再在组内等概率抽角色，
+        # 等价于每个角色的权重为 组概率/组内角色数
+        chars = []
+        weights = []
+        for p in pool['pool'].values():
+            if p[key] <= 0 or not p['pool']:
+                continue
+            weight = p[key] / len(p['pool'])
+            prefix = p.get('prefix', '')
+            for c in p['pool']:
+                chars.append(prefix + c)
+                weights.append(weight)
+        return chars, Alias_table(weights)
+
+    def _ssr_prop(self, chars: List[str], table: Alias_table) -> float:
+        # 每个格子的概率为 1/n，其中 prob 的部分属于自身，其余属于 alias
+        n = len(table)
+        prop = 0.
+        for i in range(n):
+            if chars[i] in self.ssr:
+                prop += table.prob[i] / n
+            if chars[table.alias[i]] in self.ssr:
+                prop += (1 - table.prob[i]) / n
+        return prop
+
+    def result(self, rand: Callable[[], float] = random.random) -> List[str]:
+        result_list = [self.chars[self.table.sample(rand)]
+                       for _ in range(self.combo - 1)]
+        result_list.append(self.chars_last[self.table_last.sample(rand)])
+        if self.shuffle:
+            random.shuffle(result_list)
+        return result_list
+
+    def draw_batch(self, times: int) -> Tuple[Dict[str, int], List[str]]:
+        """
+        一次抽 times 发十连（不打乱每发十连内的顺序）
+
+        返回 (每个角色抽到的次数, 按抽到的顺序排列的ssr)
+        """
+        normal = self.table.sample_many(times * (self.combo - 1))
+        last = self.table_last.sample_many(times)
+        offset = len(self.chars)
+        if numpy is not None:
+            drawn = numpy.hstack((
+                normal.reshape(times, self.combo - 1),
+                (last + offset).reshape(times, 1),
+            )).ravel()
+            counts = numpy.bincount(drawn, minlength=len(self._all_chars))
+            counter = collections.Counter()
+            for i in numpy.nonzero(counts)[0]:
+                counter[self._all_chars[i]] += int(counts[i])
+            ssr_hits = drawn[numpy.array(self._is_ssr)[drawn]]
+            return counter, [self._all_chars[i] for i in ssr_hits]
+        drawn = []
+        step = self.combo - 1
+        for t in range(times):
+            drawn.extend(normal[t * step:(t + 1) * step])
+            drawn.append(last[t] + offset)
+        counter = collections.Counter(self._all_chars[i] for i in drawn)
+        return counter, [self._all_chars[i] for i in drawn if self._is_ssr[i]]
+
+    def _ssr_cdf(self, times: int) -> List[float]:
+        cdf = self._well_cdf.get(times)
+        if cdf is None:
+            # 一井的ssr数 = 两个二项分布之和
+            normal = _binomial_pmf(times * (self.combo - 1), self.ssr_prop)
+            last = _binomial_pmf(times, self.ssr_prop_last)
+            pmf = [0.] * (len(normal) + len(last) - 1)
+            for i, a in enumerate(normal):
+                for j, b in enumerate(last):
+                    pmf[i + j] += a * b
+            cdf = []
+            acc = 0.
+            for x in pmf:
+                acc += x
+                cdf.append(acc)
+            self._well_cdf[times] = cdf
+        return cdf
+
+    def simulate_wells(self, wells: int, times: int = 30) -> Sequence[int]:
+        """
+        模拟 wells 井（每井 times 发十连），返回每井抽到的ssr数
+        """
+        if numpy is not None:
+            return (numpy.random.binomial(
+                        times * (self.combo - 1), self.ssr_prop, wells)
+                    + numpy.random.binomial(times, self.ssr_prop_last, wells))
+        cdf = self._ssr_cdf(times)
+        last = len(cdf) - 1
+        return array('l', (min(bisect.bisect_right(cdf, random.random()), last)
+                           for _ in range(wells)))
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def compile_pool(pool: Any) -> Compiled_pool:
+    """
+    检查卡池内容并编译，内容有误时抛出 CodingError
+    """
+    if not isinstance(pool, dict):
+        raise CodingError('卡池必须是一个对象')
+    settings = pool.get('settings')
+    if not isinstance(settings, dict):
+        raise CodingError('卡池缺少settings')
+    combo = settings.get('combo')
+    if not isinstance(combo, int) or isinstance(combo, bool) or combo < 1:
+        raise CodingError('combo必须是正整数')
+    day_limit = settings.get('day_limit')
+    if (not isinstance(day_limit, int) or isinstance(day_limit, bool)
+            or day_limit < 0):
+        raise CodingError('day_limit必须是非负整数')
+    if not isinstance(settings.get('shuffle'), bool):
+        raise CodingError('shuffle必须是true或false')
+    groups = pool.get('pool')
+    if not isinstance(groups, dict) or not groups:
+        raise CodingError('卡池中没有奖池')
+    for name, group in groups.items():
+        if not isinstance(group, dict):
+            raise CodingError('奖池{}格式错误'.format(name))
+        for key in ('prop', 'prop_last'):
+            if not _is_number(group.get(key)) or group[key] < 0:
+                raise CodingError('奖池{}的{}必须是非负数'.format(name, key))
+        if not isinstance(group.get('prefix', ''), str):
+            raise CodingError('奖池{}的prefix必须是字符串'.format(name))
+        chars = group.get('pool')
+        if not isinstance(chars, list) or not all(
+                isinstance(c, str) and c for c in chars):
+            raise CodingError('奖池{}的pool必须是角色名列表'.format(name))
+    # combo 为1时不使用 prop 抽卡，但仍然需要它建表和区分ssr
+    for key in ('prop', 'prop_last'):
+        if not any(g[key] > 0 and g['pool'] for g in groups.values()):
+            raise CodingError('所有奖池的{}都为0'.format(key))
+    try:
+        return Compiled_pool(pool)
+    except (KeyError, TypeError, ValueError) as e:
+        raise CodingError('卡池文件内容错误：{}'.format(e))
+
+
+# 已加载的卡池文件，用于修改文件后立即替换
+_loaded: 'weakref.WeakValueDictionary[str, Gacha_pool]' = \
+    weakref.WeakValueDictionary()
+
+
+def save_pool(path: str, pool: Dict[str, Any]) -> Compiled_pool:
+    """
+    检查并编译卡池，通过后写入文件（先写临时文件再替换），
+    并替换正在使用这个文件的卡池。内容有误时抛出 CodingError，文件不变
+    """
+    compiled = compile_pool(pool)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(pool, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, path)
+    loaded = _loaded.get(os.path.abspath(path))
+    if loaded is not None:
+        loaded._swap(compiled, os.stat(path).st_mtime_ns)
+    return compiled
+
+
+class Gacha_pool:
+    """
+    卡池文件，使用前检查文件是否被修改
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mtime = None
+        self._compiled: Compiled_pool = None
+        self.reload()
+        _loaded[os.path.abspath(path)] = self
+
+    def reload(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path, 'r', encoding='utf-8') as f:
+            try:
+                pool = json.load(f)
+            except json.JSONDecodeError:
+                raise CodingError('卡池文件解析错误，请检查卡池文件语法')
+        self._swap(compile_pool(pool), mtime)
+
+    def save(self, pool: Dict[str, Any]) -> None:
+        save_pool(self.path, pool)
+
+    def _swap(self, compiled: Compiled_pool, mtime: int):
+        # 编译好的卡池不会被修改，替换引用即可，派生的缓存随旧卡池一起丢弃
+        self._compiled = compiled
+        self._mtime = mtime
+
+    @property
+    def compiled(self) -> Compiled_pool:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return self._compiled
+        if mtime != self._mtime:
+            try:
+                self.reload()
+            except CodingError as e:
+                # 保留原来的卡池，避免改错卡池后无法抽卡
+                print('卡池文件已修改，但无法加载：{}'.format(e.error_msg))
+                self._mtime = mtime
+        return self._compiled
@@ -0,0 +1,120 @@
+"""
+抽卡次数与仓库的写回缓存
+
+当天的抽卡次数以内存中的计数为准，仓库的增量也先记在内存中，
+由定时任务每隔几秒（以及程序退出时）在一个事务中批量写入数据库，
+抽卡时不再每条消息提交一次事务。
+
+崩溃时的语义：
+- 最后一次写入之后的抽卡记录会丢失，抽卡次数和仓库都少记这部分，
+  重启后这段时间内的抽卡不计入每日上限；
+- 抽卡次数和仓库在同一个事务中写入，数据库中两者始终一致；
+- 写入失败时保留内存中的数据，下次写入时重试。
+"""
+import collections
+import time
+from typing import Dict, Iterable, List, Set
+
+from peewee import EXCLUDED, chunked
+
+from .ybdata import Gacha_collection, Gacha_user, _db
+
+
+class Gacha_store:
+    def __init__(self):
+        self._users: Dict[int, Gacha_user] = {}
+        self._dirty: Set[int] = set()
+        self._deltas: Dict[int, collections.Counter] = {}
+
+    def user(self, qqid: int) -> Gacha_user:
+        """
+        获取用户的抽卡次数，返回的对象可以直接修改，修改后调用 add
+        """
+        user = self._users.get(qqid)
+        if user is None:
+            user = Gacha_user.get_or_none(qqid=qqid)
+            if user is None:
+                user = Gacha_user(qqid=qqid, times=0, last_day='', day_times=0)
+            self._users[qqid] = user
+        today = time.strftime("%m%d")
+        if user.last_day != today:
+            user.last_day = today
+            user.day_times = 0
+        return user
+
+    def add(self, user: Gacha_user, counts: Dict[str, int]) -> None:
+        """
+        记录一次抽卡，counts 为抽到的角色及数量
+        """
+        self._dirty.add(user.qqid)
+        self._deltas.setdefault(
+            user.qqid, collections.Counter()).update(counts)
+
+    def counts(self, qqid: int, chars: Iterable[str]) -> Dict[str, int]:
+        """
+        用户仓库中指定角色的数量（只查询这些角色）
+        """
+        chars = list(chars)
+        query = Gacha_collection.select(
+            Gacha_collection.character,
+            Gacha_collection.count,
+        ).where(
+            Gacha_collection.qqid == qqid,
+            Gacha_collection.character.in_(chars),
+        )
+        result = {row.character: row.count for row in query}
+        pending = self._deltas.get(qqid)
+        if pending:
+            for char in chars:
+                if pending[char]:
+                    result[char] = result.get(char, 0) + pending[char]
+        return result
+
+    def collections(self, qqids: List[int]) -> Dict[int, Dict[str, int]]:
+        """
+        多个用户的完整仓库
+        """
+        colles = {qqid: {} for qqid in qqids}
+        query = Gacha_collection.select().where(
+            Gacha_collection.qqid.in_(qqids))
+        for row in query:
+            colles[row.qqid][row.character] = row.count
+        for qqid in qqids:
+            for char, count in self._deltas.get(qqid, {}).items():
+                colles[qqid][char] = colles[qqid].get(char, 0) + count
+        return colles
+
+    def flush(self) -> None:
+        """
+        把内存中的修改写入数据库
+        """
+        if self._dirty or self._deltas:
+            users = [{
+                'qqid': user.qqid,
+                'times': user.times,
+                'last_day': user.last_day,
+                'day_times': user.day_times,
+            } for user in (self._users[qqid] for qqid in self._dirty)]
+            colle = [{'qqid': qqid, 'character': char, 'count': count}
+                     for qqid, counter in self._deltas.items()
+                     for char, count in counter.items()]
+            with _db.atomic():
+                for batch in chunked(users, 200):
+                    Gacha_user.replace_many(batch).execute()
+                for batch in chunked(colle, 300):
+                    Gacha_collection.insert_many(batch).on_conflict(
+                        conflict_target=[Gacha_collection.qqid,
+                                         Gacha_collection.character],
+                        update={Gacha_collection.count:
+                                Gacha_collection.count + EXCLUDED.count},
+                    ).execute()
+            self._dirty.clear()
+            self._deltas.clear()
+
+        # 已写入的、今天没有抽卡的用户不再留在内存中
+        today = time.strftime("%m%d")
+        for qqid in [q for q, u in self._users.items() if u.last_day != today]:
+            del self._users[qqid]
+
+    def __len__(self):
+        return len(self._users)
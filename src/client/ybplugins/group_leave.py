@@ -1,6 +1,8 @@
 from typing import Any, Dict, Union
 
 from aiocqhttp.api import Api
+from expiringdict import ExpiringDict
+
 from .web_util import rand_string
 
 
@@ -11,7 +13,8 @@ class GroupLeave:
                  *args, **kwargs):
         self.setting = glo_setting
         self.api = bot_api
-        self.verification = {}
+        # 验证码5分钟内有效
+        self.verification = ExpiringDict(max_len=256, max_age_seconds=300)
 
     async def execute_async(self, ctx: Dict[str, Any]):
         cmd = ctx['raw_message']
@@ -0,0 +1,134 @@
+"""
+共享的 HTTP 客户端
+
+所有插件的对外请求使用同一个 aiohttp.ClientSession，复用连接和 DNS 缓存：
+
+    async with http_client.request('GET', url) as response:
+        ...
+
+会话在服务启动时（或第一次请求时）创建，服务停止时关闭。
+定时抓取的资源使用 get_if_modified 发送条件请求，未修改时不下载内容；
+新的校验值在调用者成功处理内容后用 Validators.commit 保存，处理失败时下次仍会下载
+"""
+import asyncio
+from typing import Optional, Tuple
+
+import aiohttp
+
+# 默认超时，单个请求最多30秒
+default_timeout = aiohttp.ClientTimeout(total=30, sock_connect=10)
+# 下载大文件时不限制总时间，只限制连接和每次读取
+download_timeout = aiohttp.ClientTimeout(
+    total=None, sock_connect=10, sock_read=60)
+
+_session: Optional[aiohttp.ClientSession] = None
+_session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _discard_session():
+    """
+    关闭属于其他事件循环的会话
+
+    会话只能在创建它的事件循环中关闭：事件循环仍在其他线程中运行时交给它关闭，
+    已停止时应由使用者在停止前调用 close()（基准测试等脚本结束时都会调用）
+    """
+    old, loop = _session, _session_loop
+    if old is None or old.closed:
+        return
+    if loop is not None and loop.is_running():
+        asyncio.run_coroutine_threadsafe(old.close(), loop)
+
+
+def session() -> aiohttp.ClientSession:
+    global _session, _session_loop
+    loop = asyncio.get_event_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        # 每个事件循环只能使用自己的会话（基准测试等会创建新的事件循环）
+        _discard_session()
+        connector = aiohttp.TCPConnector(
+            limit=100,
+            limit_per_host=8,
+            ttl_dns_cache=300,
+        )
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=default_timeout,
+        )
+        _session_loop = loop
+    return _session
+
+
+def request(method: str, url: str, **kwargs):
+    """
+    与 aiohttp.request 用法相同，使用共享的会话
+    """
+    return session().request(method, url, **kwargs)
+
+
+async def start():
+    session()
+
+
+async def close():
+    global _session, _session_loop
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+    _session_loop = None
+
+
+class Validators:
+    """
+    一个资源的条件请求校验值（ETag、Last-Modified）和统计
+    """
+
+    def __init__(self):
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.length = 0  # 上次下载的内容字节数
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes_saved = 0
+        # 最近一次下载得到、尚未保存的校验值
+        self._pending: Optional[Tuple[Optional[str], Optional[str], int]] = None
+
+    def commit(self):
+        """
+        内容已成功处理，以后的请求使用这次下载的校验值
+        """
+        if self._pending is not None:
+            self.etag, self.last_modified, self.length = self._pending
+            self._pending = None
+
+    def headers(self) -> dict:
+        headers = {}
+        if self.etag is not None:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified is not None:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+async def get_if_modified(url: str, validators: Validators,
+                          headers: dict = None,
+                          **kwargs) -> Tuple[int, Optional[str]]:
+    """
+    发送条件请求，返回 (状态码, 内容)，未修改时返回 (304, None)
+    """
+    headers = dict(headers or {})
+    headers.update(validators.headers())
+    validators.requests += 1
+    async with request('GET', url, headers=headers, **kwargs) as response:
+        if response.status == 304:
+            validators.not_modified += 1
+            validators.bytes_saved += validators.length
+            return 304, None
+        body = await response.read()
+        text = body.decode(response.get_encoding(), errors='replace')
+        if response.status == 200:
+            validators._pending = (
+                response.headers.get('ETag'),
+                response.headers.get('Last-Modified'),
+                len(body),
+            )
+        return response.status, text
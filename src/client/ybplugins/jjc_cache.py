@@ -0,0 +1,71 @@
+"""
+竞技场查询结果缓存
+
+查询结果保存在本地解法库中，以解法库中的保存时间判断是否过期。
+- 未超过有效期的结果直接使用；
+- 超过有效期但未超过保留期限的结果立即返回，同时在后台重新查询；
+- 查询失败时，保留期限内的旧结果仍然可用；
+- 同时发起的相同查询只向服务器请求一次
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .jjc_store import Jjc_store, cache_key
+
+
+class Jjc_cache:
+    def __init__(self, store: Jjc_store, ttl: float, stale: float):
+        self.store = store
+        self.ttl = ttl
+        self.stale = stale
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _load(self, source: str, region: int,
+              char_ids: List[Any]) -> Optional[Tuple[Any, float]]:
+        stored = self.store.get(source, region, char_ids)
+        if stored is None or stored[1] > self.ttl + self.stale:
+            return None
+        return stored
+
+    def _fetch(self, source: str, region: int, char_ids: List[Any],
+               fetch: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        key = cache_key(source, region, char_ids)
+        future = self._inflight.get(key)
+        if future is not None:
+            return future
+
+        async def fetch_and_save():
+            try:
+                value = await fetch()
+                self.store.add(source, region, char_ids, value)
+                return value
+            finally:
+                del self._inflight[key]
+
+        future = asyncio.ensure_future(fetch_and_save())
+        self._inflight[key] = future
+        return future
+
+    async def get(self, source: str, region: int, char_ids: Iterable[Any],
+                  fetch: Callable[[], Awaitable[Any]]) -> Tuple[Any, float]:
+        """
+        返回 (结果, 结果的时间距今的秒数)，
+        fetch 为查询函数，返回值需要可以转换为json，抛出的异常在没有旧结果时传给调用者
+        """
+        char_ids = list(char_ids)
+        cached = self._load(source, region, char_ids)
+        if cached is not None:
+            if cached[1] <= self.ttl:
+                return cached
+            # 先返回旧结果，后台更新
+            future = self._fetch(source, region, char_ids, fetch)
+            future.add_done_callback(_ignore_exception)
+            return cached
+        value = await asyncio.shield(
+            self._fetch(source, region, char_ids, fetch))
+        return value, 0.
+
+
+def _ignore_exception(future: asyncio.Future):
+    if not future.cancelled():
+        future.exception()
@@ -1,14 +1,17 @@
 import asyncio
 import json
 import os
-import random
 import time
-from dataclasses import dataclass
-from typing import Dict, List, Optional, Tuple
-from urllib.parse import urljoin
+from dataclasses import asdict, dataclass
+from typing import List, Optional
 
 import aiohttp
 
+from . import http_client
+from .jjc_cache import Jjc_cache
+from .jjc_store import Jjc_store
+from .nickname_index import Nickname_index
+from .page_cache import Page_cache
 from .templating import render_template
 from .yobot_exceptions import ServerError
 
@@ -26,6 +29,18 @@ class Solution:
     good: int
     bad: int
     time: str
+    # 部分防守角色查询时，解法对应的防守队伍
+    defense: Optional[List[int]] = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Solution':
+        return cls(
+            team=[Chara(**c) for c in data['team']],
+            good=data['good'],
+            bad=data['bad'],
+            time=data['time'],
+            defense=data.get('defense'),
+        )
 
 
 class Consult:
@@ -35,43 +50,48 @@ class Consult:
     Nicknames_csv = "https://gitee.com/yobot/pcr-nickname/raw/master/nicknames.csv"
     Nicknames_repo = "https://gitee.com/yobot/pcr-nickname/blob/master/nicknames.csv"
 
-    def __init__(self, glo_setting: dict, *args, **kwargs):
+    def __init__(self, glo_setting: dict,
+                 page_cache: Page_cache = None, *args, **kwargs):
         self.setting = glo_setting
-        self.nickname_dict: Dict[str, Tuple[str, str]] = {}
+        self.page_cache = page_cache
+        self.nicknames = Nickname_index({})
+        self.solutions = Jjc_store()
+        self.results = Jjc_cache(
+            self.solutions,
+            ttl=glo_setting.get("jjc_cache_hours", 6) * 3600,
+            stale=glo_setting.get("jjc_cache_stale_days", 3) * 86400,
+        )
+        self._nicknames_checktime = 0
         nickfile = os.path.join(glo_setting["dirname"], "nickname3.csv")
         if not os.path.exists(nickfile):
-            asyncio.ensure_future(self.update_nicknames(),
+            asyncio.ensure_future(self._update_nicknames_background(),
                                   loop=asyncio.get_event_loop())
         else:
-            with open(nickfile, encoding="utf-8-sig") as f:
-                csv = f.read()
-                for line in csv.split("\n")[1:]:
-                    row = line.split(",")
-                    for col in row:
-                        self.nickname_dict[col] = (row[0], row[1])
-        self.output_foler = os.path.join(self.setting['dirname'], 'output')
-        self.output_num = len(os.listdir(self.output_foler))
+            self.nicknames = Nickname_index.load(nickfile)
 
     async def update_nicknames(self):
         nickfile = os.path.join(self.setting["dirname"], "nickname3.csv")
         try:
-            async with aiohttp.request('GET', self.Nicknames_csv) as resp:
+            async with http_client.request('GET', self.Nicknames_csv) as resp:
                 if resp.status != 200:
                     raise ServerError(
                         "bad server response. code: "+str(resp.status))
                 restxt = await resp.text()
                 with open(nickfile, "w", encoding="utf-8-sig") as f:
                     f.write(restxt)
-        except aiohttp.ClientError as e:
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             raise RuntimeError('错误'+str(e))
-        with open(nickfile, encoding="utf-8-sig") as f:
-            csv = f.read()
-            for line in csv.split("\n")[1:]:
-                row = line.split(",")
-                for col in row:
-                    self.nickname_dict[col] = (row[0], row[1])
+        # 建立索引需要约1秒，在线程池中进行，不阻塞事件循环
+        self.nicknames = await asyncio.get_event_loop().run_in_executor(
+            None, Nickname_index.load, nickfile)
 
-    def user_input(self, cmd: str, is_retry=False):
+    async def _update_nicknames_background(self):
+        try:
+            await self.update_nicknames()
+        except Exception as e:
+            print("昵称表更新失败：{}".format(e))
+
+    def user_input(self, cmd: str):
         def_set = set()
         in_list = cmd.split()
         if len(in_list) == 1:
@@ -79,33 +99,54 @@ class Consult:
         if len(in_list) > 5:
             raise ValueError("防守人数过多")
         for index in in_list:
-            item = self.nickname_dict.get(index.lower(), None)
+            item = self.nicknames.lookup(index)
             if item is None:
-                if is_retry:
-                    msg = "没有找到【{}】，目前昵称表：{}".format(
-                        index, self.Nicknames_repo)
-                    asyncio.ensure_future(self.update_nicknames())
-                    raise ValueError(msg)
-                else:
-                    self.__init__(self.setting, refresh_nickfile=True)
-                    return self.user_input(cmd, True)
+                msg = "没有找到【{}】".format(index)
+                suggestions = self.nicknames.suggest(index)
+                if suggestions:
+                    msg += "，你要找的是不是：" + "、".join(suggestions)
+                msg += "\n目前昵称表：{}".format(self.Nicknames_repo)
+                self._refresh_nicknames()
+                raise ValueError(msg)
             def_set.add(item)
         def_lst = list(def_set)
-        if len(def_lst) < 5:
-            raise ValueError("需要完整的5人防守队伍")
         return def_lst
 
+    def _refresh_nicknames(self):
+        # 查不到昵称时更新昵称表，每小时最多一次
+        now = time.time()
+        if now < self._nicknames_checktime:
+            return
+        self._nicknames_checktime = now + 3600
+        asyncio.ensure_future(self._update_nicknames_background())
+
     async def jjcsearch_async(self, def_lst, region):
         search_source = self.setting["jjc_search"]
+        if search_source == "nomae.net":
+            search = self.search_nomae_async
+        elif search_source == "pcrdfans.com":
+            search = self.search_pcrdfans_async
+        else:
+            return f"错误的配置项：{search_source}"
+        char_ids = [char_id for char_id, _ in def_lst]
+        if len(def_lst) < 5:
+            return await self.partial_search_async(def_lst, region, search_source)
+
+        async def fetch():
+            return [asdict(s) for s in await search(def_lst, region)]
+
+        offline = False
         try:
-            if search_source == "nomae.net":
-                result = await self.search_nomae_async(def_lst, region)
-            elif search_source == "pcrdfans.com":
-                result = await self.search_pcrdfans_async(def_lst, region)
-            else:
-                return f"错误的配置项：{search_source}"
+            data, age = await self.results.get(
+                search_source, region, char_ids, fetch)
         except (RuntimeError, ValueError) as e:
-            return str(e)
+            # 服务器无法查询时使用本地解法库
+            stored = self.solutions.get(search_source, region, char_ids)
+            if stored is None:
+                return str(e)
+            data, age = stored
+            offline = True
+        result = [Solution.from_dict(d) for d in data]
 
         if len(result) == 0:
             return '没有找到公开的解法'
@@ -119,15 +160,41 @@ class Consult:
             search_source=search_source,
         )
 
-        self.output_num += 1
-        filename = 'solution-{}-{}.html'.format(self.output_num, random.randint(0, 999))
-        with open(os.path.join(self.output_foler, filename), 'w', encoding='utf-8') as f:
-            f.write(page)
-        addr = urljoin(
-            self.setting['public_address'],
-            '{}output/{}'.format(
-                self.setting['public_basepath'], filename))
+        addr = self.page_cache.url(self.setting, self.page_cache.put(page))
         reply = '找到{}条解法：{}'.format(len(result), addr)
+        if offline:
+            reply += '\n（无法查询，以下是{}天前保存的结果）'.format(int(age // 86400))
+        elif age > self.results.ttl:
+            reply += '\n（{}小时前的结果，正在更新）'.format(int(age // 3600))
+        if self.setting['web_mode_hint']:
+            reply += '\n\n如果无法打开，请仔细阅读教程中《链接无法打开》的说明'
+        return reply
+
+    async def partial_search_async(self, def_lst, region, search_source):
+        defenses = self.solutions.search(
+            search_source, region, (char_id for char_id, _ in def_lst))
+        if not defenses:
+            return '本地解法库中没有包含这些角色的防守队伍，请输入完整的5人防守队伍'
+        result = []
+        for defense, data in defenses:
+            for d in data:
+                solution = Solution.from_dict(d)
+                solution.defense = defense
+                result.append(solution)
+        result.sort(key=lambda s: s.good - s.bad, reverse=True)
+        result = result[:30]
+
+        page = await render_template(
+            'jjc-solution.html',
+            def_lst=def_lst,
+            region=region,
+            result=result,
+            public_base=self.setting["public_basepath"],
+            search_source=search_source,
+        )
+        addr = self.page_cache.url(self.setting, self.page_cache.put(page))
+        reply = '本地解法库中有{}个包含这些角色的防守队伍，共{}条解法：{}'.format(
+            len(defenses), len(result), addr)
         if self.setting['web_mode_hint']:
             reply += '\n\n如果无法打开，请仔细阅读教程中《链接无法打开》的说明'
         return reply
@@ -139,7 +206,7 @@ class Consult:
             equip = team['equip'].split('_')[0].split('/')
         atk = team['atk'].split('/')[1:]
         chara_team = [Chara(
-            char_id=int(self.nickname_dict[atk[i].split(',')[0]][0]),
+            char_id=int(self.nicknames.lookup(atk[i].split(',')[0])[0]),
             stars=int(atk[i].split(',')[1]),
             equip=bool(int(equip[i])),
         ) for i in range(5)]
@@ -173,13 +240,13 @@ class Consult:
         while retry >= 0:
             retry -= 1
             try:
-                async with aiohttp.request(
+                async with http_client.request(
                     'POST',
                     'https://nomae.net/princess_connect/public/_arenadb/receive.php',
                     headers=headers,
                         data=req) as resp:
                     restxt = await resp.text()
-            except aiohttp.ClientError as e:
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
                 raise RuntimeError('错误'+str(e))
             try:
                 receive = json.loads(restxt)
@@ -214,14 +281,14 @@ class Consult:
         payload = {"_sign": "a", "def": id_list, "nonce": "a",
                    "page": 1, "sort": 1, "ts": int(time.time()), "region": region}
         try:
-            async with aiohttp.request(
+            async with http_client.request(
                 'POST',
                 'https://api.pcrdfans.com/x/v1/search',
                 headers=headers,
                 json=payload,
             ) as resp:
                 restxt = await resp.text()
-        except aiohttp.ClientError as e:
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             raise RuntimeError('错误'+str(e))
         try:
             search = json.loads(restxt)
@@ -0,0 +1,76 @@
+"""
+本地竞技场解法库
+
+每次从服务器查到的解法按防守队伍长期保存，并建立 角色id -> 防守队伍 的倒排索引，
+用于服务器无法连接时回答查询过的防守队伍，以及只知道部分防守角色时的查询。
+没有解法的防守队伍也会保存，作为查询缓存，但不参与部分角色的查询
+"""
+import json
+import time
+from typing import Any, Iterable, List, Optional, Tuple
+
+from peewee import fn
+
+from .ybdata import Jjc_defense, Jjc_defense_char, _db
+
+
+def cache_key(source: str, region: int, char_ids: Iterable[Any]) -> str:
+    return '{}:{}:{}'.format(
+        source, region, ','.join(sorted(str(c) for c in char_ids)))
+
+
+class Jjc_store:
+    def add(self, source: str, region: int,
+            char_ids: Iterable[Any], result: List[dict]) -> None:
+        char_ids = [int(c) for c in char_ids]
+        key = cache_key(source, region, char_ids)
+        with _db.atomic():
+            Jjc_defense.replace(
+                key=key,
+                source=source,
+                region=region,
+                result=json.dumps(result, ensure_ascii=False),
+                update_time=int(time.time()),
+            ).execute()
+            Jjc_defense_char.insert_many(
+                [{'char_id': c, 'defense': key} for c in char_ids]
+            ).on_conflict_ignore().execute()
+
+    def get(self, source: str, region: int,
+            char_ids: Iterable[Any]) -> Optional[Tuple[List[dict], float]]:
+        """
+        保存的解法和保存时间距今的秒数
+        """
+        row = Jjc_defense.get_or_none(key=cache_key(source, region, char_ids))
+        if row is None:
+            return None
+        return json.loads(row.result), time.time() - row.update_time
+
+    def search(self, source: str, region: int, char_ids: Iterable[Any],
+               limit: int = 10) -> List[Tuple[List[int], List[dict]]]:
+        """
+        包含所有指定角色的防守队伍，最近保存的在前，
+        返回 [(防守角色id, 解法), ...]
+        """
+        char_ids = list({int(c) for c in char_ids})
+        query = Jjc_defense.select(
+            Jjc_defense.key,
+            Jjc_defense.result,
+        ).join(
+            Jjc_defense_char,
+            on=(Jjc_defense_char.defense == Jjc_defense.key),
+        ).where(
+            Jjc_defense_char.char_id.in_(char_ids),
+            Jjc_defense.source == source,
+            Jjc_defense.region == region,
+            Jjc_defense.result != '[]',
+        ).group_by(
+            Jjc_defense.key,
+        ).having(
+            fn.COUNT(Jjc_defense_char.char_id) == len(char_ids),
+        ).order_by(
+            Jjc_defense.update_time.desc(),
+        ).limit(limit)
+        return [([int(c) for c in row.key.rsplit(':', 1)[1].split(',')],
+                 json.loads(row.result))
+                for row in query]
@@ -0,0 +1,145 @@
+"""
+角色昵称索引
+
+昵称统一为半角、小写、简体后作为键，查不到时用 BK 树查找编辑距离最近的昵称作为建议。
+编译好的索引保存在昵称表旁边（nickname3.index.json），昵称表不变时直接加载
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+from opencc import OpenCC
+
+_cc_t2s = None
+
+
+def normalize(name: str) -> str:
+    global _cc_t2s
+    if _cc_t2s is None:
+        _cc_t2s = OpenCC('t2s')
+    name = unicodedata.normalize('NFKC', name).strip().lower()
+    return _cc_t2s.convert(name)
+
+
+def edit_distance(a: str, b: str) -> int:
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1,
+                               current[j - 1] + 1,
+                               previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+class Nickname_index:
+    Version = 1
+
+    def __init__(self, names: Dict[str, Tuple[str, str]], tree: list = None):
+        # 昵称 -> (角色id, 日文名)
+        self.names = names
+        # BK 树的节点为 [昵称, [[距离, 子节点], ...]]
+        self.tree = tree if tree is not None else self._build_tree(names)
+
+    @classmethod
+    def from_csv(cls, text: str) -> 'Nickname_index':
+        names = {}
+        rows = csv.reader(io.StringIO(text.lstrip('\ufeff')))
+        next(rows, None)  # 表头
+        for row in rows:
+            if len(row) < 2:
+                continue
+            for col in row:
+                key = normalize(col)
+                if key:
+                    names[key] = (row[0], row[1])
+        return cls(names)
+
+    @classmethod
+    def load(cls, csv_path: str) -> 'Nickname_index':
+        """
+        加载昵称表，昵称表未修改时使用保存的索引
+        """
+        with open(csv_path, encoding='utf-8-sig') as f:
+            text = f.read()
+        source = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        index_path = os.path.splitext(csv_path)[0] + '.index.json'
+        try:
+            with open(index_path, encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved['version'] == cls.Version and saved['source'] == source:
+                return cls({k: tuple(v) for k, v in saved['names'].items()},
+                           saved['tree'])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        index = cls.from_csv(text)
+        temp_path = index_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': cls.Version,
+                'source': source,
+                'names': index.names,
+                'tree': index.tree,
+            }, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temp_path, index_path)
+        return index
+
+    @staticmethod
+    def _build_tree(names) -> Optional[list]:
+        root = None
+        for name in names:
+            if root is None:
+                root = [name, []]
+                continue
+            node = root
+            while True:
+                dist = edit_distance(name, node[0])
+                for child_dist, child in node[1]:
+                    if child_dist == dist:
+                        node = child
+                        break
+                else:
+                    node[1].append([dist, [name, []]])
+                    break
+        return root
+
+    def lookup(self, name: str) -> Optional[Tuple[str, str]]:
+        return self.names.get(normalize(name))
+
+    def suggest(self, name: str, limit: int = 3) -> List[str]:
+        """
+        编辑距离最近的昵称，短的昵称只允许差1个字
+        """
+        name = normalize(name)
+        if self.tree is None or not name:
+            return []
+        tolerance = 1 if len(name) <= 3 else 2
+        found = []
+        stack = [self.tree]
+        while stack:
+            node = stack.pop()
+            dist = edit_distance(name, node[0])
+            if dist <= tolerance:
+                found.append((dist, node[0]))
+            for child_dist, child in node[1]:
+                if abs(child_dist - dist) <= tolerance:
+                    stack.append(child)
+        found.sort()
+        result = []
+        chars = set()
+        for _, key in found:
+            # 同一个角色只给出最接近的昵称
+            if self.names[key] not in chars:
+                chars.add(self.names[key])
+                result.append(key)
+        return result[:limit]
+
+    def __len__(self):
+        return len(self.names)
@@ -0,0 +1,123 @@
+"""
+output 目录中生成文件的存储
+
+文件以内容哈希命名保存在 output/store 中，相同内容只保存一份。
+写入时先写临时文件再替换，不会读到写了一半的文件。
+定时任务删除超过保存期限的文件，总大小超过上限时删除最久未访问的文件；
+旧版本在 output 中生成的页面（output/<数字>/、solution-*.html）超过期限后也一并删除
+"""
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+_legacy_dir = re.compile(r'^\d+$')
+_legacy_file = re.compile(r'^solution-\d+-\d+\.html$')
+
+
+class Output_store:
+    def __init__(self, output_path: str, max_bytes: int, max_age: float):
+        self.output_path = output_path
+        self.path = os.path.join(output_path, 'store')
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.size = 0
+        self._lock = threading.Lock()
+        # 文件名 -> [大小, 最后访问时间, 文件的修改时间]
+        self._files: Dict[str, List[float]] = {}
+        os.makedirs(self.path, exist_ok=True)
+        for entry in os.scandir(self.path):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith('.tmp'):
+                # 上次写入时中断留下的临时文件
+                os.remove(entry.path)
+                continue
+            stat = entry.stat()
+            self._files[entry.name] = [
+                stat.st_size, stat.st_mtime, stat.st_mtime]
+            self.size += stat.st_size
+
+    def put(self, data: bytes, suffix: str = '') -> str:
+        """
+        保存内容，返回文件名（相对于 output/store）
+        """
+        name = hashlib.sha256(data).hexdigest()[:32] + suffix
+        with self._lock:
+            item = self._files.get(name)
+            if item is not None:
+                item[1] = time.time()
+                return name
+            fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.path)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, os.path.join(self.path, name))
+            now = time.time()
+            self._files[name] = [len(data), now, now]
+            self.size += len(data)
+        return name
+
+    def get(self, name: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._files.get(name)
+            if item is None:
+                return None
+            item[1] = time.time()
+        try:
+            with open(os.path.join(self.path, name), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def gc(self) -> int:
+        """
+        删除过期文件，并按最久未访问删除到总大小不超过上限，返回删除的文件数
+        """
+        now = time.time()
+        removed = 0
+        with self._lock:
+            by_access = sorted(self._files.items(), key=lambda x: x[1][1])
+            for name, (size, last_access, _) in by_access:
+                if last_access >= now - self.max_age and self.size <= self.max_bytes:
+                    break
+                self._remove(name)
+                removed += 1
+            # 把访问时间保存为修改时间，重启后仍按访问时间淘汰
+            for name, item in self._files.items():
+                if item[1] == item[2]:
+                    continue
+                try:
+                    os.utime(os.path.join(self.path, name), (item[1], item[1]))
+                except FileNotFoundError:
+                    pass
+                item[2] = item[1]
+        return removed + self._gc_legacy(now)
+
+    def _remove(self, name: str):
+        size = self._files.pop(name)[0]
+        self.size -= size
+        try:
+            os.remove(os.path.join(self.path, name))
+        except FileNotFoundError:
+            pass
+
+    def _gc_legacy(self, now: float) -> int:
+        removed = 0
+        for entry in os.scandir(self.output_path):
+            if not (_legacy_dir.match(entry.name) or _legacy_file.match(entry.name)):
+                continue
+            if entry.stat().st_mtime >= now - self.max_age:
+                continue
+            if entry.is_dir():
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                os.remove(entry.path)
+            removed += 1
+        return removed
+
+    def __len__(self):
+        return len(self._files)
@@ -0,0 +1,84 @@
+"""
+生成的网页缓存
+
+仓库、竞技场解法等页面渲染后以内容哈希为键保存在内存中，通过 page/<哈希>.html 访问，
+不再每次在 output 目录中创建文件。超过有效期的页面失效，
+总大小超过上限时淘汰最久未访问的页面。
+指定了 Output_store 时页面同时保存到磁盘，内存中没有的页面从磁盘读取
+"""
+import collections
+import hashlib
+import time
+from typing import Optional, Tuple
+from urllib.parse import urljoin
+
+from .output_store import Output_store
+
+
+class Page_cache:
+    sweep_interval = 60
+
+    def __init__(self, max_bytes: int, ttl: float,
+                 store: Output_store = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.store = store
+        self.size = 0
+        self._pages: 'collections.OrderedDict[str, Tuple[float, bytes]]' = \
+            collections.OrderedDict()
+        self._next_sweep = 0.
+
+    def put(self, page: str) -> str:
+        """
+        保存页面，返回页面的键（相同内容的页面只保存一份）
+        """
+        data = page.encode('utf-8')
+        key = hashlib.sha256(data).hexdigest()[:32]
+        self._add(key, data)
+        if self.store is not None:
+            self.store.put(data, '.html')
+        return key
+
+    def get(self, key: str) -> Optional[bytes]:
+        item = self._pages.get(key)
+        if item is not None and item[0] < time.time():
+            self._remove(key)
+            item = None
+        if item is None:
+            if self.store is None:
+                return None
+            data = self.store.get(key + '.html')
+            if data is None:
+                return None
+            self._add(key, data)
+            return data
+        self._pages.move_to_end(key)
+        return item[1]
+
+    def _add(self, key: str, data: bytes):
+        self._remove(key)
+        self._pages[key] = (time.time() + self.ttl, data)
+        self.size += len(data)
+        self._evict()
+
+    def url(self, setting: dict, key: str) -> str:
+        return urljoin(
+            setting['public_address'],
+            '{}page/{}.html'.format(setting['public_basepath'], key))
+
+    def _remove(self, key: str):
+        item = self._pages.pop(key, None)
+        if item is not None:
+            self.size -= len(item[1])
+
+    def _evict(self):
+        now = time.time()
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.sweep_interval
+            for key in [k for k, v in self._pages.items() if v[0] < now]:
+                self._remove(key)
+        while self.size > self.max_bytes and len(self._pages) > 1:
+            self._remove(next(iter(self._pages)))
+
+    def __len__(self):
+        return len(self._pages)
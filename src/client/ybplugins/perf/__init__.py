@@ -0,0 +1,5 @@
+from .monitor import Monitor
+
+__all__ = [
+    'Monitor',
+]
@@ -0,0 +1,245 @@
+"""
+公会战核心操作基准测试
+
+在临时目录中用 ybdata.init 建立数据库，按 公会数 × 成员数 × 天数 × 期数
+填充出刀记录，然后反复执行公会战的核心操作，输出耗时分位数和查询次数。
+不需要连接QQ或网络，可以离线运行：
+
+    cd src/client
+    python -m ybplugins.perf.bench_clan_battle --groups 10 --members 30
+    python -m ybplugins.perf.bench_clan_battle --save bench.json
+    python -m ybplugins.perf.bench_clan_battle --compare bench.json
+
+--compare 时如果某个操作的查询次数增加，或中位耗时增加超过 --tolerance，
+以返回值 1 退出
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+from .. import ybdata
+from ..clan_battle import ClanBattle
+from ..clan_battle.util import pcr_datetime
+from ..ybdata import Clan_challenge, Clan_group, Clan_member, User
+from . import query_budget
+
+_default_config = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__)))),
+    'packedfiles', 'default_config.json')
+
+
+def seed(groups: int, members: int, days: int, battles: int,
+         server: str = 'cn', rand: random.Random = None):
+    """
+    填充数据，最后一期公会战的最后一天为今天，
+    今天前一半成员已出满3刀，后一半成员还未出刀
+    """
+    rand = rand or random.Random(0)
+    today = pcr_datetime(server)[0]
+    users = []
+    clan_members = []
+    challenges = []
+    for g in range(groups):
+        group_id = 100000 + g
+        Clan_group.create(
+            group_id=group_id,
+            group_name='bench{}'.format(g),
+            game_server=server,
+            battle_id=battles - 1,
+        )
+        for m in range(members):
+            qqid = group_id * 1000 + m
+            users.append({'qqid': qqid, 'nickname': 'member{}'.format(m),
+                          'clan_group_id': group_id})
+            clan_members.append({'group_id': group_id, 'qqid': qqid})
+        for bid in range(battles):
+            first_day = today - (battles - 1 - bid) * 30 - (days - 1)
+            kills = 0
+            for day in range(first_day, first_day + days):
+                for m in range(members):
+                    if day == today and m >= members // 2:
+                        continue
+                    qqid = group_id * 1000 + m
+                    for num in range(1, 4):
+                        killed = rand.random() < 0.2
+                        challenges.append({
+                            'bid': bid,
+                            'gid': group_id,
+                            'qqid': qqid,
+                            'challenge_pcrdate': day,
+                            'challenge_pcrtime': rand.randrange(86400),
+                            'boss_cycle': 1 + kills // 5,
+                            'boss_num': rand.randint(1, 5),
+                            'boss_health_ramain': (
+                                0 if killed else rand.randrange(1, 6000000)),
+                            'challenge_damage': rand.randrange(100000, 3000000),
+                            'is_continue': False,
+                            'is_second': False,
+                            'continue_num': num,
+                        })
+                        if killed:
+                            kills += 1
+    with ybdata._db.atomic():
+        for model, rows in ((User, users),
+                            (Clan_member, clan_members),
+                            (Clan_challenge, challenges)):
+            for i in range(0, len(rows), 500):
+                model.insert_many(rows[i:i+500]).execute()
+    return len(challenges)
+
+
+def _percentile(sorted_values: List[float], p: float) -> float:
+    index = min(len(sorted_values) - 1,
+                max(0, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Bench_result:
+    def __init__(self, name: str):
+        self.name = name
+        self.elapsed: List[float] = []
+        self.queries: List[int] = []
+
+    def add(self, elapsed: float, queries: int):
+        self.elapsed.append(elapsed * 1000)
+        self.queries.append(queries)
+
+    def to_dict(self) -> Dict[str, Any]:
+        values = sorted(self.elapsed)
+        return {
+            'name': self.name,
+            'n': len(values),
+            'p50_ms': round(_percentile(values, 50), 3),
+            'p90_ms': round(_percentile(values, 90), 3),
+            'p99_ms': round(_percentile(values, 99), 3),
+            'max_ms': round(values[-1], 3),
+            'avg_queries': round(sum(self.queries) / len(self.queries), 2),
+            'max_queries': max(self.queries),
+        }
+
+
+def _measure(result: Bench_result, func: Callable, *args, **kwargs):
+    with query_budget.operation('bench:' + result.name) as stats:
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+    result.add(elapsed, stats.queries)
+
+
+def run(groups: int = 5,
+        members: int = 30,
+        days: int = 6,
+        battles: int = 3,
+        repeat: int = 50,
+        seed_value: int = 0) -> List[Dict[str, Any]]:
+    if members < 2:
+        raise ValueError('members 至少为 2')
+    if battles < 2:
+        raise ValueError('battles 至少为 2')
+    rand = random.Random(seed_value)
+    with tempfile.TemporaryDirectory() as dirname:
+        with open(_default_config, encoding='utf-8') as f:
+            setting = json.load(f)
+        setting['dirname'] = dirname
+        ybdata.init(os.path.join(dirname, 'yobotdata.db'))
+        try:
+            count = seed(groups, members, days, battles, rand=rand)
+            print('已生成{}个公会，{}条出刀记录'.format(groups, count))
+            asyncio.set_event_loop(asyncio.new_event_loop())
+            clan = ClanBattle(glo_setting=setting, bot_api=None)
+            query_budget.install()
+            # 基准测试中不输出出刀日志和超预算警告
+            logging.disable(logging.WARNING)
+
+            results = {name: Bench_result(name) for name in (
+                'challenge', 'undo', 'boss_status_summary', 'get_report',
+                'get_clan_daily_challenge_counts', 'switch_data_slot',
+            )}
+            group_ids = [100000 + g for g in range(groups)]
+            for i in range(repeat):
+                group_id = rand.choice(group_ids)
+                # 今天还未出刀的成员
+                qqid = group_id * 1000 + rand.randrange(members // 2, members)
+                _measure(results['challenge'], clan.challenge,
+                         group_id, qqid, False, 1, 1000)
+                _measure(results['undo'], clan.undo, group_id, qqid)
+                _measure(results['boss_status_summary'],
+                         clan.boss_status_summary, group_id)
+                # get_report 带有10秒缓存，这里测量未命中缓存的情况
+                _measure(results['get_report'],
+                         clan.get_report, group_id, None, nocache=True)
+                _measure(results['get_clan_daily_challenge_counts'],
+                         clan.get_clan_daily_challenge_counts, group_id)
+                _measure(results['switch_data_slot'],
+                         clan.switch_data_slot, group_id, battles - 2)
+                clan.switch_data_slot(group_id, battles - 1)
+        finally:
+            logging.disable(logging.NOTSET)
+            ybdata._db.close()
+    return [r.to_dict() for r in results.values()]
+
+
+def compare(results: List[Dict[str, Any]],
+            baseline: List[Dict[str, Any]],
+            tolerance: float) -> List[str]:
+    regressions = []
+    old = {item['name']: item for item in baseline}
+    for item in results:
+        base = old.get(item['name'])
+        if base is None:
+            continue
+        if item['max_queries'] > base['max_queries']:
+            regressions.append('{}：查询次数 {} -> {}'.format(
+                item['name'], base['max_queries'], item['max_queries']))
+        if item['p50_ms'] > base['p50_ms'] * (1 + tolerance):
+            regressions.append('{}：中位耗时 {}ms -> {}ms'.format(
+                item['name'], base['p50_ms'], item['p50_ms']))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='公会战核心操作基准测试')
+    parser.add_argument('--groups', type=int, default=5, help='公会数')
+    parser.add_argument('--members', type=int, default=30, help='每个公会的成员数')
+    parser.add_argument('--days', type=int, default=6, help='每期公会战天数')
+    parser.add_argument('--battles', type=int, default=3, help='公会战期数（至少2）')
+    parser.add_argument('--repeat', type=int, default=50, help='每个操作执行次数')
+    parser.add_argument('--seed', type=int, default=0, help='随机数种子')
+    parser.add_argument('--save', help='将结果保存为json文件')
+    parser.add_argument('--compare', help='与保存的json结果比较')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='中位耗时允许增加的比例')
+    args = parser.parse_args(argv)
+
+    results = run(args.groups, args.members, args.days, args.battles,
+                  args.repeat, args.seed)
+
+    print('{:<34}{:>6}{:>10}{:>10}{:>10}{:>10}{:>8}{:>8}'.format(
+        '操作', 'n', 'p50(ms)', 'p90(ms)', 'p99(ms)', 'max(ms)', '平均查询', '最大查询'))
+    for item in results:
+        print('{name:<34}{n:>6}{p50_ms:>10.2f}{p90_ms:>10.2f}{p99_ms:>10.2f}'
+              '{max_ms:>10.2f}{avg_queries:>8.1f}{max_queries:>8}'.format(**item))
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print('性能退化：\n' + '\n'.join(regressions))
+            return 1
+        print('未发现性能退化')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+资讯网页解析基准测试
+
+比较爬虫解析整个页面（原来的方式）和只解析需要的标签（parse_only）的耗时，
+并检查两种方式得到的资讯是否相同。页面来自保存的网页文件，
+没有指定时使用生成的台服官网样式的页面，可以离线运行：
+
+    cd src/client
+    python -m ybplugins.perf.bench_spider_parse
+    python -m ybplugins.perf.bench_spider_parse --fetch news.html
+    python -m ybplugins.perf.bench_spider_parse --fixture news.html
+
+--fetch 下载台服官网当前的新闻页面保存为文件，以后可以用 --fixture 离线比较。
+两种方式得到的资讯不同时以返回值 1 退出
+"""
+import argparse
+import asyncio
+import sys
+import time
+from typing import Callable, Dict, List
+
+from bs4 import BeautifulSoup
+
+from .. import http_client
+from ..spider import base_spider
+from ..spider.official_site_tw import Spider_ostw
+
+
+def sample_page(items: int = 10, filler: int = 200) -> str:
+    """
+    生成与台服官网新闻页结构相似的页面：
+    导航、脚本和大量无关标签中间有一个 <dl> 新闻列表
+    """
+    nav = ''.join(
+        '<li class="nav-item"><a href="/menu/{0}/">菜单{0}</a></li>'.format(i)
+        for i in range(30))
+    blocks = ''.join(
+        '<div class="block"><p class="text">段落{0} <span>说明</span>'
+        '<a href="/page/{0}">链接</a></p><img src="/img/{0}.png" alt=""></div>'
+        .format(i)
+        for i in range(filler))
+    news = ''.join(
+        '<dt><span class="date">2020.06.{0:02d}</span>'
+        '<span class="tag">活動</span></dt>'
+        '<dd><a href="/news/newsDetail/{1}">新聞標題 {1} 活動開催中</a></dd>'
+        .format(i % 28 + 1, 1000 - i)
+        for i in range(items))
+    return (
+        '<!DOCTYPE html><html lang="zh-TW"><head><meta charset="utf-8">'
+        '<title>最新消息</title>'
+        '<script>var config = {"a": "<dd>not news</dd>"};</script>'
+        '<link rel="stylesheet" href="/css/style.css"></head><body>'
+        '<header><ul class="nav">' + nav + '</ul></header>'
+        '<main>' + blocks[:len(blocks) // 2]
+        + '<section class="news"><dl class="news-list">' + news + '</dl></section>'
+        + blocks[len(blocks) // 2:] + '</main>'
+        '<footer><p>&copy; So-net</p></footer></body></html>')
+
+
+async def fetch_page(path: str) -> str:
+    spider = Spider_ostw()
+    try:
+        text, code = await spider.get_content_async()
+    finally:
+        await http_client.close()
+    if code != 200:
+        raise RuntimeError('下载失败，返回值：{}'.format(code))
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return text
+
+
+def _percentile(sorted_values: List[float], p: float) -> float:
+    index = min(len(sorted_values) - 1,
+                int(len(sorted_values) * p / 100))
+    return sorted_values[index]
+
+
+def _measure(func: Callable[[], object], repeat: int) -> Dict[str, float]:
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed.append((time.perf_counter() - start) * 1000)
+    elapsed.sort()
+    return {
+        'p50_ms': _percentile(elapsed, 50),
+        'p90_ms': _percentile(elapsed, 90),
+        'max_ms': elapsed[-1],
+    }
+
+
+def run(pages: Dict[str, str], repeat: int = 50) -> int:
+    spider = Spider_ostw()
+    parsers = ['html.parser']
+    if base_spider.html_parser != 'html.parser':
+        parsers.append(base_spider.html_parser)
+    methods = []
+    for parser in parsers:
+        methods.append(('{} 整个页面'.format(parser), parser, None))
+        methods.append(('{} parse_only'.format(parser), parser,
+                        spider.parse_only))
+
+    mismatches = 0
+    print('{:<20}{:<28}{:>6}{:>10}{:>10}{:>10}{:>8}'.format(
+        '页面', '方式', '资讯数', 'p50(ms)', 'p90(ms)', 'max(ms)', '加速'))
+    for page_name, text in pages.items():
+        expected = None
+        baseline = None
+        for name, parser, parse_only in methods:
+            def parse():
+                return spider.get_items(
+                    BeautifulSoup(text, parser, parse_only=parse_only))
+            items = [(i.idx, i.content) for i in parse()]
+            if expected is None:
+                expected = items
+            elif items != expected:
+                mismatches += 1
+                print('{}：{} 得到的资讯与解析整个页面不同'.format(page_name, name))
+            result = _measure(parse, repeat)
+            if baseline is None:
+                baseline = result['p50_ms']
+            print('{:<20}{:<28}{:>6}{p50_ms:>10.2f}{p90_ms:>10.2f}'
+                  '{max_ms:>10.2f}{:>7.1f}x'.format(
+                      page_name[:19], name, len(items),
+                      baseline / result['p50_ms'], **result))
+    return mismatches
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='资讯网页解析基准测试')
+    parser.add_argument('--fixture', action='append', default=[],
+                        help='保存的网页文件，可以指定多个')
+    parser.add_argument('--fetch', help='下载台服官网新闻页面并保存到此文件')
+    parser.add_argument('--items', type=int, default=10, help='生成页面的新闻条数')
+    parser.add_argument('--repeat', type=int, default=50, help='每种方式解析次数')
+    args = parser.parse_args(argv)
+
+    pages = {}
+    if args.fetch:
+        pages[args.fetch] = asyncio.get_event_loop().run_until_complete(
+            fetch_page(args.fetch))
+    for path in args.fixture:
+        with open(path, encoding='utf-8') as f:
+            pages[path] = f.read()
+    if not pages:
+        pages['生成的页面'] = sample_page(args.items)
+
+    if run(pages, args.repeat):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,373 @@
+"""
+公会战夜晚压力测试
+
+模拟一个 OneBot（cqhttp）客户端，以反向 websocket（Universal）连接到
+已经启动的 yobot（main.py），向它发送大量群消息事件，并回应 yobot 的
+api 调用（send_group_msg、get_group_member_list 等，全部记录次数）；
+同时模拟登录了网页面板的成员，并发请求 clan/<group_id>/api/。
+结束后输出吞吐量、回复延迟和错误率。
+
+会创建大量公会和成员，请使用单独的数据目录启动 yobot 后再运行：
+
+    python main.py -g                # 另一个终端
+    python -m ybplugins.perf.load_battle_night --url http://127.0.0.1:9222/ \\
+        --groups 100 --members 30 --duration 300 --web-clients 50
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import random
+import re
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+
+import aiohttp
+
+from .bench_clan_battle import _percentile
+
+# 消息权重：报刀、尾刀、状态、查刀
+_commands = [
+    ('报刀', 50),
+    ('尾刀', 10),
+    ('状态', 25),
+    ('查刀', 15),
+]
+
+
+def fake_api_data(action: str, params: Dict[str, Any], self_id: int,
+                  members: Dict[int, List[int]],
+                  message_id: Iterator[int]) -> Any:
+    """
+    OneBot api 调用的模拟返回值，members 为 群号 -> 成员QQ号列表
+    """
+    if action == 'get_login_info':
+        return {'user_id': self_id, 'nickname': 'loadtest'}
+    if action == 'get_group_list':
+        return [{'group_id': g, 'group_name': 'load{}'.format(g)}
+                for g in members]
+    if action == 'get_group_member_list':
+        return [{'group_id': params.get('group_id'), 'user_id': q,
+                 'nickname': str(q), 'card': str(q), 'role': 'member'}
+                for q in members.get(params.get('group_id'), [])]
+    if action == 'get_group_member_info':
+        return {'group_id': params.get('group_id'),
+                'user_id': params.get('user_id'),
+                'nickname': str(params.get('user_id')),
+                'card': str(params.get('user_id')), 'role': 'member'}
+    if action.startswith('send_'):
+        return {'message_id': next(message_id)}
+    return None
+
+
+class Load_stats:
+    def __init__(self):
+        self.latency: Dict[str, List[float]] = collections.defaultdict(list)
+        self.errors: Dict[str, int] = collections.Counter()
+        self.api_calls: Dict[str, int] = collections.Counter()
+        self.elapsed = 0.
+
+    def add(self, kind: str, elapsed: float):
+        self.latency[kind].append(elapsed * 1000)
+
+    def error(self, kind: str):
+        self.errors[kind] += 1
+
+    def report(self, elapsed: float) -> List[Dict[str, Any]]:
+        result = []
+        for kind in sorted(set(self.latency) | set(self.errors)):
+            values = sorted(self.latency[kind])
+            total = len(values) + self.errors[kind]
+            item = {
+                'name': kind,
+                'n': total,
+                'errors': self.errors[kind],
+                'error_rate': self.errors[kind] / total,
+                'per_second': total / elapsed,
+            }
+            for p in (50, 90, 99):
+                item['p{}_ms'.format(p)] = (
+                    _percentile(values, p) if values else None)
+            result.append(item)
+        return result
+
+
+class Fake_onebot:
+    """
+    反向 websocket 的 OneBot 客户端，
+    发送消息事件，并把 yobot 对每条消息的快速回复交给等待者
+    """
+
+    def __init__(self, url: str, self_id: int, token: Optional[str],
+                 stats: Load_stats, members: Dict[int, List[int]]):
+        parsed = urlparse(url)
+        scheme = 'wss' if parsed.scheme == 'https' else 'ws'
+        self.ws_url = '{}://{}/ws/'.format(scheme, parsed.netloc)
+        self.self_id = self_id
+        self.token = token
+        self.stats = stats
+        self.members = members
+        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self._message_id = itertools.count(1)
+        self._waiting: Dict[int, asyncio.Future] = {}
+
+    async def connect(self, session: aiohttp.ClientSession):
+        headers = {
+            'X-Self-ID': str(self.self_id),
+            'X-Client-Role': 'Universal',
+        }
+        if self.token:
+            headers['Authorization'] = 'Token ' + self.token
+        self._ws = await session.ws_connect(self.ws_url, headers=headers)
+        asyncio.ensure_future(self._receive())
+
+    async def close(self):
+        if self._ws is not None:
+            await self._ws.close()
+
+    async def _receive(self):
+        async for msg in self._ws:
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                continue
+            frame = json.loads(msg.data)
+            action = frame.get('action', '')
+            params = frame.get('params', {})
+            self.stats.api_calls[action] += 1
+            if action.startswith('.handle_quick_operation'):
+                message_id = params.get('context', {}).get('message_id')
+                future = self._waiting.pop(message_id, None)
+                if future is not None and not future.done():
+                    future.set_result(
+                        params.get('operation', {}).get('reply'))
+            await self._ws.send_str(json.dumps({
+                'status': 'ok',
+                'retcode': 0,
+                'data': fake_api_data(action, params, self.self_id,
+                                      self.members, self._message_id),
+                'echo': frame.get('echo'),
+            }))
+
+    async def send_group_message(self, group_id: int, user_id: int,
+                                 text: str, kind: str,
+                                 role: str = 'member',
+                                 timeout: float = 30) -> Optional[str]:
+        """
+        发送一条群消息并等待回复，超时或连接断开记为错误
+        """
+        message_id = next(self._message_id)
+        future = asyncio.get_event_loop().create_future()
+        self._waiting[message_id] = future
+        event = {
+            'post_type': 'message',
+            'message_type': 'group',
+            'sub_type': 'normal',
+            'time': int(time.time()),
+            'self_id': self.self_id,
+            'message_id': message_id,
+            'group_id': group_id,
+            'user_id': user_id,
+            'message': text,
+            'raw_message': text,
+            'font': 0,
+            'sender': {
+                'user_id': user_id,
+                'nickname': str(user_id),
+                'card': str(user_id),
+                'role': role,
+            },
+        }
+        start = time.perf_counter()
+        try:
+            await self._ws.send_str(json.dumps(event))
+            reply = await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, ConnectionError):
+            self._waiting.pop(message_id, None)
+            self.stats.error(kind)
+            return None
+        self.stats.add(kind, time.perf_counter() - start)
+        return reply
+
+
+def _random_command(rand: random.Random) -> Tuple[str, str]:
+    kind = rand.choices([c[0] for c in _commands],
+                        weights=[c[1] for c in _commands])[0]
+    if kind == '报刀':
+        return kind, '报刀{} {}w'.format(rand.randint(1, 5),
+                                       rand.randint(50, 800))
+    if kind == '尾刀':
+        return kind, '尾刀{}'.format(rand.randint(1, 5))
+    return kind, kind
+
+
+async def setup_groups(bot: Fake_onebot, members: Dict[int, List[int]],
+                       concurrency: int, timeout: float):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def join(group_id, qqid):
+        async with semaphore:
+            await bot.send_group_message(group_id, qqid, '加入公会',
+                                         'setup:加入公会', timeout=timeout)
+
+    for group_id, qqids in members.items():
+        await bot.send_group_message(group_id, qqids[0], '创建国服公会',
+                                     'setup:创建公会', role='owner',
+                                     timeout=timeout)
+    await asyncio.gather(*(join(g, q) for g, qqids in members.items()
+                           for q in qqids))
+
+
+async def group_traffic(bot: Fake_onebot, group_id: int, qqids: List[int],
+                        rate: float, deadline: float,
+                        rand: random.Random, timeout: float):
+    """
+    以平均每分钟 rate 条的速度（泊松分布）发送公会战命令
+    """
+    tasks = []
+    while True:
+        await asyncio.sleep(rand.expovariate(rate / 60))
+        if time.monotonic() >= deadline:
+            break
+        kind, text = _random_command(rand)
+        tasks.append(asyncio.ensure_future(bot.send_group_message(
+            group_id, rand.choice(qqids), text, kind, timeout=timeout)))
+    await asyncio.gather(*tasks)
+
+
+async def web_client(bot: Fake_onebot, base_url: str, group_id: int,
+                     qqid: int, interval: float, deadline: float,
+                     stats: Load_stats, timeout: float):
+    """
+    通过“登录”命令取得登录地址，登录后定时刷新面板
+    """
+    reply = await bot.send_group_message(group_id, qqid, '登录',
+                                         'setup:登录', timeout=timeout)
+    match = reply and re.search(r'qqid=(\d+)&key=(\w+)', reply)
+    if not match:
+        stats.error('web:login')
+        return
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with aiohttp.ClientSession(
+            timeout=client_timeout,
+            cookie_jar=aiohttp.CookieJar(unsafe=True)) as session:
+        try:
+            async with session.get(urljoin(base_url, 'login/'), params={
+                    'qqid': match.group(1), 'key': match.group(2)}) as res:
+                await res.read()
+            async with session.get(urljoin(
+                    base_url, 'clan/{}/'.format(group_id))) as res:
+                page = await res.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            stats.error('web:login')
+            return
+        csrf = re.search(r'var csrf_token = "(\w+)"', page)
+        if not csrf:
+            stats.error('web:login')
+            return
+        api_url = urljoin(base_url, 'clan/{}/api/'.format(group_id))
+        while time.monotonic() < deadline:
+            for action, extra in (('get_data', {}),
+                                  ('get_challenge', {'ts': int(time.time())})):
+                kind = 'web:' + action
+                start = time.perf_counter()
+                try:
+                    async with session.post(api_url, json={
+                            'action': action,
+                            'csrf_token': csrf.group(1),
+                            **extra}) as res:
+                        data = await res.json(content_type=None)
+                except (aiohttp.ClientError, asyncio.TimeoutError,
+                        ValueError):
+                    stats.error(kind)
+                    continue
+                if res.status != 200 or data.get('code') != 0:
+                    stats.error(kind)
+                else:
+                    stats.add(kind, time.perf_counter() - start)
+            await asyncio.sleep(interval)
+
+
+async def run(args) -> Load_stats:
+    rand = random.Random(args.seed)
+    stats = Load_stats()
+    members = {
+        900000000 + g: [800000000 + g * 1000 + m for m in range(args.members)]
+        for g in range(args.groups)
+    }
+    bot = Fake_onebot(args.url, args.self_id, args.token, stats, members)
+    async with aiohttp.ClientSession() as session:
+        await bot.connect(session)
+        if not args.skip_setup:
+            print('正在创建{}个公会...'.format(args.groups))
+            await setup_groups(bot, members, args.concurrency,
+                               args.reply_timeout)
+        print('开始模拟，持续{}秒'.format(args.duration))
+        start = time.monotonic()
+        deadline = start + args.duration
+        group_ids = list(members)
+        tasks = [group_traffic(bot, g, members[g], args.rate, deadline,
+                               random.Random(rand.random()),
+                               args.reply_timeout)
+                 for g in group_ids]
+        for i in range(args.web_clients):
+            group_id = group_ids[i % len(group_ids)]
+            tasks.append(web_client(
+                bot, args.url, group_id, rand.choice(members[group_id]),
+                args.web_interval, deadline, stats, args.reply_timeout))
+        await asyncio.gather(*tasks)
+        stats.elapsed = time.monotonic() - start
+        await bot.close()
+    return stats
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='公会战夜晚压力测试')
+    parser.add_argument('--url', default='http://127.0.0.1:9222/',
+                        help='yobot地址（含public_basepath）')
+    parser.add_argument('--token', help='access_token')
+    parser.add_argument('--self-id', type=int, default=10000, help='机器人QQ号')
+    parser.add_argument('--groups', type=int, default=50, help='公会数')
+    parser.add_argument('--members', type=int, default=30, help='每个公会的成员数')
+    parser.add_argument('--duration', type=float, default=300, help='持续秒数')
+    parser.add_argument('--rate', type=float, default=6,
+                        help='每个公会平均每分钟的消息数')
+    parser.add_argument('--web-clients', type=int, default=20,
+                        help='同时打开面板的成员数')
+    parser.add_argument('--web-interval', type=float, default=5,
+                        help='面板刷新间隔秒数')
+    parser.add_argument('--concurrency', type=int, default=50,
+                        help='创建公会时的并发数')
+    parser.add_argument('--reply-timeout', type=float, default=30,
+                        help='等待回复的超时秒数')
+    parser.add_argument('--skip-setup', action='store_true',
+                        help='公会和成员已存在时跳过创建')
+    parser.add_argument('--seed', type=int, default=0, help='随机数种子')
+    parser.add_argument('--json', help='将结果保存为json文件')
+    args = parser.parse_args(argv)
+
+    loop = asyncio.get_event_loop()
+    stats = loop.run_until_complete(run(args))
+    results = stats.report(stats.elapsed)
+
+    print('{:<24}{:>8}{:>8}{:>9}{:>9}{:>10}{:>10}{:>10}'.format(
+        '类型', 'n', '错误', '错误率', '次/秒', 'p50(ms)', 'p90(ms)', 'p99(ms)'))
+    for item in results:
+        print('{:<24}{:>8}{:>8}{:>9.1%}{:>9.2f}{:>10}{:>10}{:>10}'.format(
+            item['name'], item['n'], item['errors'], item['error_rate'],
+            item['per_second'], *(
+                '-' if item[k] is None else '{:.1f}'.format(item[k])
+                for k in ('p50_ms', 'p90_ms', 'p99_ms'))))
+    print('api调用：' + '，'.join(
+        '{} {}'.format(k, v) for k, v in stats.api_calls.most_common()))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'elapsed': stats.elapsed, 'results': results,
+                       'api_calls': stats.api_calls},
+                      f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
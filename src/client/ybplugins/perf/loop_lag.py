@@ -0,0 +1,140 @@
+"""
+事件循环延迟监控
+
+协程每隔 interval 秒醒来一次，醒来的延迟即为调度延迟；
+另有一个看门狗线程，发现事件循环超过阈值没有醒来时，
+抓取事件循环线程当前的调用栈，即正在阻塞事件循环的代码
+"""
+import asyncio
+import bisect
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional
+
+_logger = logging.getLogger(__name__)
+
+interval = 0.1
+threshold_ms = 100
+
+# 直方图上界（毫秒），最后一个桶为超过最大上界
+_buckets = [1, 5, 10, 50, 100, 500, 1000, 5000]
+_histogram = [0] * (len(_buckets) + 1)
+_max_lag_ms = 0.
+_samples = 0
+
+# 项目代码所在目录，用于在调用栈中定位阻塞位置
+_project_dir = os.path.normcase(os.path.dirname(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__)))))
+
+_offenders: collections.deque = collections.deque(maxlen=50)
+# 调用栈末尾位置 -> [次数, 总阻塞时间ms]
+_offender_summary: Dict[str, List[float]] = {}
+
+_loop_thread_id: Optional[int] = None
+_last_tick = 0.
+_pending: Optional[Dict[str, Any]] = None
+_running = False
+
+
+def _record_lag(lag_ms: float):
+    global _max_lag_ms, _samples, _pending
+    _samples += 1
+    _histogram[bisect.bisect_left(_buckets, lag_ms)] += 1
+    _max_lag_ms = max(_max_lag_ms, lag_ms)
+    offender = _pending
+    if offender is not None:
+        _pending = None
+        offender['lag_ms'] = round(lag_ms, 1)
+        item = _offender_summary.setdefault(offender['where'], [0, 0.])
+        item[0] += 1
+        item[1] += lag_ms
+        _logger.warning('事件循环被阻塞%.0fms：%s\n%s',
+                        lag_ms, offender['where'], ''.join(offender['stack']))
+
+
+def _capture():
+    global _pending
+    frame = sys._current_frames().get(_loop_thread_id)
+    if frame is None:
+        return
+    stack = traceback.extract_stack(frame)
+    # 取最内层的项目代码作为阻塞位置，找不到时取最内层
+    blocking = stack[-1]
+    for item in reversed(stack):
+        filename = os.path.normcase(os.path.abspath(item.filename))
+        if filename.startswith(_project_dir) and 'site-packages' not in filename:
+            blocking = item
+            break
+    where = '{}:{} {}'.format(
+        os.path.basename(blocking.filename), blocking.lineno, blocking.name)
+    offender = {
+        'time': int(time.time()),
+        'lag_ms': None,
+        'where': where,
+        'stack': traceback.format_list(stack),
+    }
+    _offenders.append(offender)
+    _pending = offender
+
+
+def _watchdog():
+    captured_tick = None
+    while _running:
+        time.sleep(interval / 2)
+        tick = _last_tick
+        if tick == captured_tick:
+            continue
+        # 正常情况下相邻两次醒来间隔 interval 秒
+        if (time.monotonic() - tick) * 1000 > interval * 1000 + threshold_ms:
+            # 每次阻塞只抓取一次
+            captured_tick = tick
+            _capture()
+
+
+async def run():
+    global _loop_thread_id, _last_tick, _running
+    if _running:
+        return
+    _running = True
+    _loop_thread_id = threading.get_ident()
+    _last_tick = time.monotonic()
+    threading.Thread(target=_watchdog, name='yobot-loop-watchdog',
+                     daemon=True).start()
+    loop = asyncio.get_event_loop()
+    try:
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            _last_tick = time.monotonic()
+            _record_lag((loop.time() - start - interval) * 1000)
+    finally:
+        _running = False
+
+
+def configure(glo_setting: Dict[str, Any]):
+    global threshold_ms
+    threshold_ms = glo_setting.get('perf_loop_lag_ms', threshold_ms)
+    if threshold_ms:
+        asyncio.ensure_future(run(), loop=asyncio.get_event_loop())
+
+
+def stats() -> Dict[str, Any]:
+    labels = ['≤{}ms'.format(b) for b in _buckets] + [
+        '>{}ms'.format(_buckets[-1])]
+    return {
+        'samples': _samples,
+        'max_lag_ms': round(_max_lag_ms, 1),
+        'histogram': [{'bucket': label, 'count': count}
+                      for label, count in zip(labels, _histogram)],
+        'offenders': list(reversed(_offenders)),
+        'offender_summary': [
+            {'where': where, 'count': item[0], 'total_ms': round(item[1], 1)}
+            for where, item in sorted(_offender_summary.items(),
+                                      key=lambda x: -x[1][1])
+        ],
+    }
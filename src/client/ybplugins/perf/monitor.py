@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import os
+import threading
+from typing import Any, Dict
+from urllib.parse import urljoin
+
+from quart import (Quart, g, jsonify, make_response, redirect, request,
+                   session, url_for)
+
+from ..templating import render_template
+from ..ybdata import User
+from . import loop_lag, profiler, query_budget, slow_query, tracing
+
+
+class Monitor:
+    Passive = False
+    Active = False
+    Request = True
+
+    def __init__(self,
+                 glo_setting: Dict[str, Any],
+                 *args, **kwargs):
+        self.setting = glo_setting
+
+        # log
+        if not os.path.exists(os.path.join(glo_setting['dirname'], 'log')):
+            os.mkdir(os.path.join(glo_setting['dirname'], 'log'))
+
+        logger = logging.getLogger(__package__)
+        if not logger.handlers:
+            formater = logging.Formatter(
+                '[%(asctime)s] %(levelname)s: %(message)s')
+            filehandler = logging.FileHandler(
+                os.path.join(glo_setting['dirname'], 'log', '性能日志.log'),
+                encoding='utf-8',
+            )
+            filehandler.setFormatter(formater)
+            consolehandler = logging.StreamHandler()
+            consolehandler.setFormatter(formater)
+            logger.addHandler(filehandler)
+            logger.addHandler(consolehandler)
+            logger.setLevel(logging.INFO)
+
+        query_budget.configure(glo_setting)
+        slow_query.configure(glo_setting)
+        loop_lag.configure(glo_setting)
+        tracing.configure(glo_setting)
+
+    def _get_data(self) -> Dict[str, Any]:
+        return {
+            'query_summary': query_budget.summary(),
+            'slow_queries': slow_query.records(),
+            'loop_lag': loop_lag.stats(),
+            'traces': tracing.stats(),
+        }
+
+    def register_routes(self, app: Quart):
+
+        @app.before_request
+        async def yobot_perf_begin():
+            g.yobot_query_stats = query_budget.begin(request.endpoint)
+
+        @app.after_request
+        async def yobot_perf_end(response):
+            stats = getattr(g, 'yobot_query_stats', None)
+            if stats is not None:
+                query_budget.end(stats)
+            return response
+
+        @app.route(
+            urljoin(self.setting['public_basepath'], 'admin/perf/'),
+            methods=['GET'])
+        async def yobot_perf():
+            if 'yobot_user' not in session:
+                return redirect(url_for('yobot_login', callback=request.path))
+            user = User.get_by_id(session['yobot_user'])
+            if user.authority_group >= 10:
+                if not user.authority_group >= 100:
+                    uathname = '公会战管理员'
+                else:
+                    uathname = '成员'
+                return await render_template(
+                    'unauthorized.html',
+                    limit='主人',
+                    uath=uathname,
+                )
+            return await render_template('admin/perf.html')
+
+        @app.route(
+            urljoin(self.setting['public_basepath'], 'admin/perf/api/'),
+            methods=['POST'])
+        async def yobot_perf_api():
+            if 'yobot_user' not in session:
+                return jsonify(
+                    code=10,
+                    message='Not logged in',
+                )
+            user = User.get_by_id(session['yobot_user'])
+            if user.authority_group >= 10:
+                return jsonify(
+                    code=11,
+                    message='Insufficient authority',
+                )
+            try:
+                req = await request.get_json()
+                if req is None:
+                    return jsonify(
+                        code=30,
+                        message='Invalid payload',
+                    )
+                if req.get('csrf_token') != session['csrf_token']:
+                    return jsonify(
+                        code=15,
+                        message='Invalid csrf_token',
+                    )
+                action = req['action']
+                if action == 'get_data':
+                    return jsonify(code=0, **self._get_data())
+                else:
+                    return jsonify(code=32, message='unknown action')
+            except KeyError as e:
+                return jsonify(code=31, message=str(e))
+
+        @app.route(
+            urljoin(self.setting['public_basepath'], 'admin/perf/profile/'),
+            methods=['POST'])
+        async def yobot_perf_profile():
+            if 'yobot_user' not in session:
+                return jsonify(
+                    code=10,
+                    message='Not logged in',
+                )
+            user = User.get_by_id(session['yobot_user'])
+            if user.authority_group >= 10:
+                return jsonify(
+                    code=11,
+                    message='Insufficient authority',
+                )
+            try:
+                req = await request.get_json()
+                if req is None:
+                    return jsonify(
+                        code=30,
+                        message='Invalid payload',
+                    )
+                if req.get('csrf_token') != session['csrf_token']:
+                    return jsonify(
+                        code=15,
+                        message='Invalid csrf_token',
+                    )
+                seconds = float(req['seconds'])
+                # 本函数运行在事件循环线程中
+                thread_id = (threading.get_ident()
+                             if req.get('thread') == 'loop' else None)
+            except KeyError as e:
+                return jsonify(code=31, message=str(e))
+            except ValueError as e:
+                return jsonify(code=30, message=str(e))
+            try:
+                counts = await asyncio.get_event_loop().run_in_executor(
+                    None, profiler.sample, seconds, thread_id)
+            except profiler.ProfilerBusy as e:
+                return jsonify(code=33, message=str(e))
+            res = await make_response(profiler.collapsed(counts))
+            res.headers['Content-Type'] = 'text/plain; charset=utf-8'
+            res.headers['Content-Disposition'] = (
+                'attachment; filename="yobot-profile.txt"')
+            return res
@@ -0,0 +1,157 @@
+"""
+按“逻辑操作”（一条QQ命令或一次网页请求）统计数据库查询
+
+用法：
+    with query_budget.operation('ClanBattle.3'):
+        ...
+
+    # 测试中断言查询次数
+    with query_budget.assert_max_queries(12):
+        clan_battle.challenge(...)
+"""
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from ..ybdata import Sql_event, _db
+
+_logger = logging.getLogger(__name__)
+
+_current: contextvars.ContextVar = contextvars.ContextVar(
+    'yobot_query_stats', default=None)
+
+# 超出预算时记录日志，0 表示不限制
+budget = {
+    'queries': 30,
+    'ms': 500,
+}
+
+# 操作名 -> [次数, 总查询数, 最大查询数, 总耗时ms, 超预算次数]
+_summary: Dict[str, List[float]] = {}
+
+
+class Query_stats:
+    def __init__(self, name: str):
+        self.name = name
+        self.events: List[Sql_event] = []
+        self.start = time.perf_counter()
+        self.elapsed = None
+        self.closed = False
+
+    @property
+    def queries(self) -> int:
+        return len(self.events)
+
+    @property
+    def rows(self) -> int:
+        return sum(e.rows for e in self.events)
+
+    @property
+    def db_ms(self) -> float:
+        return sum(e.elapsed for e in self.events) * 1000
+
+    def close(self):
+        self.closed = True
+        self.elapsed = time.perf_counter() - self.start
+
+    def over_budget(self) -> bool:
+        if budget['queries'] and self.queries > budget['queries']:
+            return True
+        if budget['ms'] and self.db_ms > budget['ms']:
+            return True
+        return False
+
+    def __str__(self):
+        return '{}：{}次查询，{}行，数据库耗时{:.1f}ms'.format(
+            self.name, self.queries, self.rows, self.db_ms)
+
+
+def _on_sql(event: Sql_event):
+    stats = _current.get()
+    if stats is not None and not stats.closed:
+        stats.events.append(event)
+
+
+def install():
+    if _on_sql not in _db.sql_hooks:
+        _db.sql_hooks.append(_on_sql)
+
+
+def configure(glo_setting: Dict[str, Any]):
+    budget['queries'] = glo_setting.get('perf_query_budget', budget['queries'])
+    budget['ms'] = glo_setting.get('perf_query_budget_ms', budget['ms'])
+    install()
+
+
+def current() -> Optional[Query_stats]:
+    return _current.get()
+
+
+def set_name(name: str):
+    """
+    修改当前操作的名称（比如网页api在解析出action后）
+    """
+    stats = _current.get()
+    if stats is not None:
+        stats.name = name
+
+
+def begin(name: str) -> Query_stats:
+    """
+    开始统计，之后在同一个上下文中执行的sql都计入此操作
+    """
+    stats = Query_stats(name)
+    _current.set(stats)
+    return stats
+
+
+def end(stats: Query_stats):
+    if stats.closed:
+        return
+    stats.close()
+    item = _summary.setdefault(stats.name, [0, 0, 0, 0., 0])
+    item[0] += 1
+    item[1] += stats.queries
+    item[2] = max(item[2], stats.queries)
+    item[3] += stats.db_ms
+    if stats.over_budget():
+        item[4] += 1
+        _logger.warning('超出查询预算 %s', stats)
+
+
+@contextmanager
+def operation(name: str):
+    stats = Query_stats(name)
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        end(stats)
+        _current.reset(token)
+
+
+@contextmanager
+def assert_max_queries(limit: int, name: str = 'assert_max_queries'):
+    install()
+    with operation(name) as stats:
+        yield stats
+    if stats.queries > limit:
+        raise AssertionError(
+            '{}，超过{}次\n'.format(stats, limit)
+            + '\n'.join(e.sql for e in stats.events))
+
+
+def summary() -> List[Dict[str, Any]]:
+    return [
+        {
+            'name': name,
+            'count': item[0],
+            'avg_queries': item[1] / item[0],
+            'max_queries': item[2],
+            'avg_ms': item[3] / item[0],
+            'over_budget': item[4],
+        }
+        for name, item in _summary.items()
+    ]
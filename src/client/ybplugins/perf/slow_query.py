@@ -0,0 +1,124 @@
+"""
+慢查询记录
+
+执行耗时超过阈值的sql会连同参数形状、调用位置和 EXPLAIN QUERY PLAN
+一起写入 log/慢查询.log（滚动日志），最近的记录保留在内存中供后台查看
+"""
+import collections
+import logging
+import logging.handlers
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+from .. import ybdata
+from ..ybdata import Sql_event, _db
+
+_logger = logging.getLogger(__name__)
+
+threshold_ms = 50
+
+_records: collections.deque = collections.deque(maxlen=200)
+
+# 调用位置跳过这些文件
+_skipped_files = (
+    os.path.normcase(os.path.abspath(__file__)),
+    os.path.normcase(os.path.abspath(ybdata.__file__)),
+)
+_explained_statements = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH')
+
+
+def _params_shape(params) -> str:
+    if not params:
+        return '()'
+    names = [type(p).__name__ for p in params]
+    if len(names) > 8:
+        counter = collections.Counter(names)
+        return '({})'.format(', '.join(
+            f'{name}×{count}' for name, count in counter.items()))
+    return '({})'.format(', '.join(names))
+
+
+def _caller() -> str:
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = os.path.normcase(os.path.abspath(frame.f_code.co_filename))
+        if (filename not in _skipped_files
+                and 'peewee' not in filename
+                and 'playhouse' not in filename):
+            return '{}:{} {}'.format(
+                os.path.basename(frame.f_code.co_filename),
+                frame.f_lineno,
+                frame.f_code.co_name,
+            )
+        frame = frame.f_back
+    return 'unknown'
+
+
+def _explain(sql: str, params) -> List[str]:
+    if not sql.lstrip().upper().startswith(_explained_statements):
+        return []
+    try:
+        # 直接使用游标，不经过 execute_sql，不计入查询统计
+        cursor = _db.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params or ())
+        rows = cursor.fetchall()
+        cursor.close()
+    except Exception as e:
+        return ['EXPLAIN失败：{}'.format(e)]
+    # (id, parent, notused, detail)
+    depth = {0: -1}
+    plan = []
+    for row in rows:
+        level = depth.get(row[1], -1) + 1
+        depth[row[0]] = level
+        plan.append('  ' * level + str(row[-1]))
+    return plan
+
+
+def _on_sql(event: Sql_event):
+    elapsed_ms = event.elapsed * 1000
+    if elapsed_ms < threshold_ms:
+        return
+    plan = _explain(event.sql, event.params)
+    record = {
+        'time': int(time.time()),
+        'elapsed_ms': round(elapsed_ms, 2),
+        'sql': event.sql,
+        'params': _params_shape(event.params),
+        'caller': _caller(),
+        'plan': plan,
+        # 计划中的 SCAN 表示没有使用索引
+        'full_scan': any(line.strip().startswith('SCAN') for line in plan),
+    }
+    _records.append(record)
+    _logger.info('%.2fms %s %s\n%s\n%s',
+                 elapsed_ms, record['caller'], record['params'],
+                 event.sql, '\n'.join(plan))
+
+
+def configure(glo_setting: Dict[str, Any]):
+    global threshold_ms
+    threshold_ms = glo_setting.get('perf_slow_query_ms', threshold_ms)
+
+    if not _logger.handlers:
+        filehandler = logging.handlers.RotatingFileHandler(
+            os.path.join(glo_setting['dirname'], 'log', '慢查询.log'),
+            maxBytes=1024 * 1024,
+            backupCount=3,
+            encoding='utf-8',
+        )
+        filehandler.setFormatter(logging.Formatter(
+            '[%(asctime)s] %(message)s'))
+        _logger.addHandler(filehandler)
+        _logger.setLevel(logging.INFO)
+        # 慢查询只写入单独的日志文件
+        _logger.propagate = False
+
+    if threshold_ms and _on_sql not in _db.sql_hooks:
+        _db.sql_hooks.append(_on_sql)
+
+
+def records() -> List[Dict[str, Any]]:
+    return list(reversed(_records))
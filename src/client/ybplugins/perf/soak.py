@@ -0,0 +1,313 @@
+"""
+长时间运行内存测试
+
+在临时数据目录中创建完整的 Yobot（使用模拟的 OneBot api 和竞技场查询服务器），
+以加速的时钟模拟多天的群消息（公会战、抽卡、竞技场查询），每隔若干天用 tracemalloc 拍一次快照。
+预热结束后的内存增长超过阈值时以返回值 1 退出，并列出增长最多的分配位置：
+
+    cd src/client
+    python -m ybplugins.perf.soak --days 14 --groups 50 --threshold-mb 20
+"""
+import argparse
+import asyncio
+import gc
+import itertools
+import json
+import linecache
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from functools import partial
+from typing import Any, Dict, List
+
+from .. import http_client, ybdata
+from ..jjc_consult import Chara, Solution
+from .load_battle_night import fake_api_data
+
+# 命令、权重、发送者身份
+_commands = [
+    ('报刀{boss} {damage}w', 40, 'member'),
+    ('尾刀{boss}', 8, 'member'),
+    ('状态', 15, 'member'),
+    ('查刀', 10, 'member'),
+    ('撤销', 3, 'member'),
+    ('登录', 5, 'member'),
+    ('十连', 10, 'member'),
+    ('仓库', 2, 'member'),
+    ('加入全部成员', 2, 'admin'),
+    ('退出此群', 2, 'admin'),
+    ('在线十连', 3, 'member'),
+    ('jjc查询 {team}', 5, 'member'),
+    ('jjc查询 {partial}', 2, 'member'),
+]
+
+# 竞技场查询使用的角色数，角色越多重复的查询越少
+_characters = 60
+
+# 打开抽卡，竞技场查询使用模拟的服务器
+_soak_config = {
+    'gacha_on': True,
+    'jjc_search': 'pcrdfans.com',
+    'jjc_auth_key': 'soak',
+}
+
+_snapshot_filters = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, linecache.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+]
+
+
+class Soak_api:
+    """
+    直接返回模拟结果的 OneBot api，记录调用次数
+    """
+
+    def __init__(self, members: Dict[int, List[int]], self_id: int = 10000):
+        self.members = members
+        self.self_id = self_id
+        self.calls: Dict[str, int] = {}
+        self._message_id = itertools.count(1)
+
+    async def call_action(self, action: str, **params) -> Any:
+        self.calls[action] = self.calls.get(action, 0) + 1
+        return fake_api_data(action, params, self.self_id,
+                             self.members, self._message_id)
+
+    def __getattr__(self, item):
+        return partial(self.call_action, item)
+
+
+def _write_data(dirname: str):
+    with open(os.path.join(dirname, 'yobot_config.json'), 'w',
+              encoding='utf-8') as f:
+        json.dump(_soak_config, f)
+    # 使用生成的昵称表，不下载
+    with open(os.path.join(dirname, 'nickname3.csv'), 'w',
+              encoding='utf-8-sig') as f:
+        f.write('id,name,nickname\n')
+        for c in range(_characters):
+            f.write('{0},キャラ{0},角色{0}\n'.format(1001 + c))
+
+
+def _fake_jjc_search(rand: random.Random):
+    async def search(def_lst: list, region: int) -> List[Solution]:
+        return [Solution(
+            team=[Chara(char_id=1001 + rand.randrange(_characters),
+                        stars=rand.randint(3, 6), equip=rand.random() < 0.5)
+                  for _ in range(5)],
+            good=rand.randrange(100),
+            bad=rand.randrange(20),
+            time='2020-06-01',
+        ) for _ in range(rand.randint(1, 10))]
+    return search
+
+
+class _Clock:
+    """
+    把 time.time 向后拨，使缓存过期、公会战日期等按模拟的天数变化
+    """
+
+    def __init__(self):
+        self.offset = 0.
+        self._time = time.time
+
+    def __enter__(self):
+        time.time = lambda: self._time() + self.offset
+        return self
+
+    def __exit__(self, *exc):
+        time.time = self._time
+
+
+def _traced_bytes(snapshot: tracemalloc.Snapshot) -> int:
+    return sum(stat.size for stat in snapshot.statistics('filename'))
+
+
+def _take_snapshot() -> tracemalloc.Snapshot:
+    gc.collect()
+    return tracemalloc.take_snapshot().filter_traces(_snapshot_filters)
+
+
+def _dir_usage(path: str):
+    count = size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            count += 1
+            size += os.path.getsize(os.path.join(root, name))
+    return count, size
+
+
+def _containers(bot, dirname: str) -> Dict[str, Any]:
+    """
+    已知可能无限增长的容器的大小
+    """
+    plugins = {type(p).__name__: p for p in
+               bot.plug_passive + bot.plug_active + bot.plug_new}
+    result = {}
+    if 'ClanBattle' in plugins:
+        result['ClanBattle._boss_status'] = len(
+            plugins['ClanBattle']._boss_status)
+    if 'GroupLeave' in plugins:
+        result['GroupLeave.verification'] = len(
+            plugins['GroupLeave'].verification)
+    if 'Gacha' in plugins:
+        result['Gacha.store'] = len(plugins['Gacha'].store)
+    if 'Consult' in plugins:
+        result['Consult.nicknames'] = len(plugins['Consult'].nicknames)
+    result['page_cache'] = len(bot.page_cache)
+    result['output_store'] = len(bot.output_store)
+    result['output文件数'], result['output字节数'] = _dir_usage(
+        os.path.join(dirname, 'output'))
+    return result
+
+
+async def _simulate_day(bot, members: Dict[int, List[int]], messages: int,
+                        rand: random.Random, message_id):
+    group_ids = list(members)
+    names = [c[0] for c in _commands]
+    weights = [c[1] for c in _commands]
+    roles = {c[0]: c[2] for c in _commands}
+    for _ in range(messages):
+        group_id = rand.choice(group_ids)
+        user_id = rand.choice(members[group_id])
+        template = rand.choices(names, weights=weights)[0]
+        team = rand.sample(range(_characters), 5)
+        text = template.format(
+            boss=rand.randint(1, 5),
+            damage=rand.randint(50, 800),
+            team=' '.join('角色{}'.format(1001 + c) for c in team),
+            partial=' '.join('角色{}'.format(1001 + c) for c in team[:2]),
+        )
+        ctx = {
+            'post_type': 'message',
+            'message_type': 'group',
+            'sub_type': 'normal',
+            'message_id': next(message_id),
+            'group_id': group_id,
+            'user_id': user_id,
+            'raw_message': text,
+            'message': text,
+            'sender': {
+                'user_id': user_id,
+                'nickname': str(user_id),
+                'card': str(user_id),
+                'role': roles[template],
+            },
+        }
+        await bot.proc_async(ctx)
+    # 等待命令中启动的后台任务
+    await asyncio.sleep(0.05)
+
+
+async def run(args) -> int:
+    # 导入 yobot 会加载全部插件，放在这里以免影响 --help
+    import yobot
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+    from quart import Quart
+
+    rand = random.Random(args.seed)
+    message_id = itertools.count(1)
+    members = {
+        900000000 + g: [800000000 + g * 1000 + m for m in range(args.members)]
+        for g in range(args.groups)
+    }
+    api = Soak_api(members)
+    with tempfile.TemporaryDirectory() as dirname, _Clock() as clock:
+        _write_data(dirname)
+        bot = yobot.Yobot(
+            data_path=dirname,
+            scheduler=AsyncIOScheduler(),
+            quart_app=Quart(__name__),
+            bot_api=api,
+            verinfo={'run-as': 'python', 'ver_name': 'yobot soak'},
+        )
+        for plugin in bot.plug_passive:
+            if type(plugin).__name__ == 'Consult':
+                plugin.search_pcrdfans_async = _fake_jjc_search(rand)
+        for group_id, qqids in members.items():
+            await bot.proc_async({
+                'message_type': 'group', 'message_id': next(message_id),
+                'group_id': group_id, 'user_id': qqids[0],
+                'raw_message': '创建国服公会',
+                'sender': {'user_id': qqids[0], 'role': 'owner'},
+            })
+
+        tracemalloc.start(args.frames)
+        baseline = None
+        baseline_bytes = 0
+        # 不输出插件日志，也不报告事件循环阻塞（本测试一直占用事件循环）
+        logging.disable(logging.WARNING)
+        try:
+            for day in range(1, args.days + 1):
+                await _simulate_day(bot, members, args.messages_per_day,
+                                    rand, message_id)
+                clock.offset += 86400
+                if day == args.warmup:
+                    baseline = _take_snapshot()
+                    baseline_bytes = _traced_bytes(baseline)
+                if day % args.snapshot_every and day != args.days:
+                    continue
+                snapshot = _take_snapshot()
+                traced = _traced_bytes(snapshot)
+                print('第{}天：已分配{:.2f}MB，较预热后{:+.2f}MB，{}'.format(
+                    day, traced / 2**20,
+                    (traced - baseline_bytes) / 2**20 if baseline else 0,
+                    json.dumps(_containers(bot, dirname),
+                               ensure_ascii=False)))
+        finally:
+            logging.disable(logging.NOTSET)
+            tracemalloc.stop()
+            for plugin in bot.plug_passive:
+                if type(plugin).__name__ == 'Gacha':
+                    await plugin.flush_on_shutdown_async()
+            await http_client.close()
+            ybdata._db.close()
+
+    growth = (traced - baseline_bytes) / 2**20
+    print('api调用：{}'.format(json.dumps(api.calls, ensure_ascii=False)))
+    print('增长最多的分配位置：')
+    for stat in snapshot.compare_to(baseline, 'traceback')[:args.top]:
+        print('{:+.1f}KB {:+d}个'.format(stat.size_diff / 1024,
+                                        stat.count_diff))
+        for line in stat.traceback.format():
+            print('    ' + line.strip())
+    if growth > args.threshold_mb:
+        print('内存增长{:.2f}MB，超过阈值{}MB'.format(
+            growth, args.threshold_mb))
+        return 1
+    print('内存增长{:.2f}MB，未超过阈值{}MB'.format(growth, args.threshold_mb))
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='长时间运行内存测试')
+    parser.add_argument('--days', type=int, default=14, help='模拟天数')
+    parser.add_argument('--warmup', type=int, default=2,
+                        help='预热天数，之后的增长计入结果')
+    parser.add_argument('--groups', type=int, default=50, help='群数')
+    parser.add_argument('--members', type=int, default=30, help='每个群的成员数')
+    parser.add_argument('--messages-per-day', type=int, default=3000,
+                        help='每天的消息数')
+    parser.add_argument('--snapshot-every', type=int, default=1,
+                        help='每隔几天输出一次快照')
+    parser.add_argument('--threshold-mb', type=float, default=20,
+                        help='允许的内存增长（MB）')
+    parser.add_argument('--top', type=int, default=10, help='列出的分配位置数')
+    parser.add_argument('--frames', type=int, default=1,
+                        help='tracemalloc 记录的调用栈深度')
+    parser.add_argument('--seed', type=int, default=0, help='随机数种子')
+    args = parser.parse_args(argv)
+    if args.warmup >= args.days:
+        parser.error('--warmup 必须小于 --days')
+    return asyncio.get_event_loop().run_until_complete(run(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
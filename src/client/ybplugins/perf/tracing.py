@@ -0,0 +1,178 @@
+"""
+消息追踪
+
+每条收到的消息生成一个 trace，记录从 handle_msg 到回复发出之间
+各阶段（前缀、黑名单、繁简转换、各插件的 match/execute、数据库、
+发送消息）的耗时。总耗时超过阈值的 trace 保存在内存环形缓冲区中，
+可以在后台查看
+"""
+import collections
+import contextvars
+import functools
+import random
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from ..ybdata import Sql_event, _db
+
+threshold_ms = 500
+
+# 每个 trace 最多记录的阶段数，超出的只计数
+MAX_SPANS = 200
+
+_current: contextvars.ContextVar = contextvars.ContextVar(
+    'yobot_trace', default=None)
+
+_slow_traces: collections.deque = collections.deque(maxlen=100)
+_total_traces = 0
+
+# message_id -> 等待回复发出的 trace
+_waiting_reply: 'collections.OrderedDict[Any, Trace]' = collections.OrderedDict()
+_MAX_WAITING = 256
+
+
+class Trace:
+    def __init__(self, context: Dict[str, Any]):
+        self.id = '{:08x}'.format(random.getrandbits(32))
+        self.time = int(time.time())
+        self.start = time.perf_counter()
+        self.context = {
+            'message_type': context.get('message_type'),
+            'group_id': context.get('group_id'),
+            'user_id': context.get('user_id'),
+            'message': str(context.get('raw_message', ''))[:50],
+        }
+        self.spans: List[List[Any]] = []
+        self.dropped_spans = 0
+        self.depth = 0
+        self.elapsed_ms: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.elapsed_ms is not None
+
+    def add_span(self, name: str, start: float, end: float, depth: int):
+        if len(self.spans) >= MAX_SPANS:
+            self.dropped_spans += 1
+            return
+        self.spans.append([
+            name,
+            round((start - self.start) * 1000, 2),
+            round((end - start) * 1000, 2),
+            depth,
+        ])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'time': self.time,
+            'elapsed_ms': self.elapsed_ms,
+            'context': self.context,
+            'dropped_spans': self.dropped_spans,
+            # [名称, 开始时间ms, 耗时ms, 层级]
+            'spans': sorted(self.spans, key=lambda s: s[1]),
+        }
+
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+
+def begin(context: Dict[str, Any]) -> Trace:
+    global _total_traces
+    _total_traces += 1
+    trace = Trace(context)
+    _current.set(trace)
+    return trace
+
+
+def finish(trace: Trace, reply_pending: bool = False, message_id=None):
+    """
+    结束 trace
+
+    如果回复还要由框架发出（quick operation），则等到 Traced_api
+    看到对应的 .handle_quick_operation 调用后再结束
+    """
+    if trace.finished:
+        return
+    if reply_pending and message_id is not None:
+        _waiting_reply[message_id] = trace
+        while len(_waiting_reply) > _MAX_WAITING:
+            _, expired = _waiting_reply.popitem(last=False)
+            _finish(expired)
+        return
+    _finish(trace)
+
+
+def _finish(trace: Trace):
+    trace.elapsed_ms = round((time.perf_counter() - trace.start) * 1000, 2)
+    if trace.elapsed_ms >= threshold_ms:
+        _slow_traces.append(trace.to_dict())
+
+
+@contextmanager
+def span(name: str):
+    trace = _current.get()
+    if trace is None or trace.finished:
+        yield
+        return
+    depth = trace.depth
+    trace.depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.depth = depth
+        trace.add_span(name, start, time.perf_counter(), depth)
+
+
+def _on_sql(event: Sql_event):
+    trace = _current.get()
+    if trace is None or trace.finished:
+        return
+    end = time.perf_counter()
+    trace.add_span('sql: ' + event.sql[:60], end - event.elapsed, end,
+                   trace.depth)
+
+
+class Traced_api:
+    """
+    包装 bot_api，把每次 api 调用记录到当前 trace 中
+    """
+
+    def __init__(self, api):
+        self._api = api
+
+    async def call_action(self, action: str, **params):
+        trace = None
+        if action.startswith('.handle_quick_operation'):
+            message_id = params.get('context', {}).get('message_id')
+            trace = _waiting_reply.pop(message_id, None)
+        if trace is not None:
+            start = time.perf_counter()
+            try:
+                return await self._api.call_action(action, **params)
+            finally:
+                trace.add_span('api: reply', start, time.perf_counter(), 0)
+                _finish(trace)
+        with span('api: ' + action):
+            return await self._api.call_action(action, **params)
+
+    def __getattr__(self, item: str):
+        return functools.partial(self.call_action, item)
+
+
+def configure(glo_setting: Dict[str, Any]):
+    global threshold_ms
+    threshold_ms = glo_setting.get('perf_trace_ms', threshold_ms)
+    if _on_sql not in _db.sql_hooks:
+        _db.sql_hooks.append(_on_sql)
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        'total': _total_traces,
+        'threshold_ms': threshold_ms,
+        'slow_traces': list(reversed(_slow_traces)),
+    }
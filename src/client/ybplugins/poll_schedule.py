@@ -0,0 +1,84 @@
+"""
+资讯源的自适应检查间隔
+
+每个资讯源记录更新间隔的指数加权平均（EWMA）和一天中各个小时的更新次数。
+下次检查的时间为预计更新间隔的 1/4：经常更新的源和经常更新的时段检查得更频繁，
+长时间没有更新的源逐渐减少检查，检查间隔限制在设置的上下限之间
+"""
+import time
+from typing import Dict, Iterable, List, Optional
+
+
+class _Source_history:
+    def __init__(self, interval: float):
+        self.interval = interval  # 更新间隔的 EWMA（秒）
+        self.last_update: Optional[float] = None
+        self.hourly: List[float] = [0.] * 24  # 每个小时的更新次数（逐渐衰减）
+
+
+class Poll_schedule:
+    alpha = 0.3  # EWMA 中新的间隔所占比例
+    hourly_decay = 0.98  # 每次更新时旧的小时统计的衰减
+    poll_ratio = 0.25  # 检查间隔与预计更新间隔的比例
+
+    def __init__(self, min_interval: float, max_interval: float):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self._sources: Dict[str, _Source_history] = {}
+
+    def _history(self, source: str) -> _Source_history:
+        history = self._sources.get(source)
+        if history is None:
+            # 没有记录时按最长间隔估计
+            history = _Source_history(self.max_interval)
+            self._sources[source] = history
+        return history
+
+    def _update(self, history: _Source_history, timestamp: float):
+        if history.last_update is not None:
+            gap = timestamp - history.last_update
+            if gap <= 0:
+                return
+            history.interval += self.alpha * (gap - history.interval)
+        history.last_update = timestamp
+        history.hourly = [c * self.hourly_decay for c in history.hourly]
+        history.hourly[time.localtime(timestamp).tm_hour] += 1
+
+    def seed(self, source: str, timestamps: Iterable[float]):
+        """
+        用资讯的发布时间初始化记录（只在还没有记录时有效）
+        """
+        history = self._history(source)
+        if history.last_update is not None:
+            return
+        for timestamp in sorted(timestamps):
+            self._update(history, timestamp)
+
+    def record(self, source: str, updated: bool, now: float = None):
+        """
+        记录一次检查的结果
+        """
+        history = self._history(source)
+        if updated:
+            self._update(history, time.time() if now is None else now)
+
+    def next_delay(self, source: str, now: float = None) -> float:
+        """
+        距离下次检查的秒数
+        """
+        if now is None:
+            now = time.time()
+        history = self._history(source)
+        interval = history.interval
+        if history.last_update is not None:
+            # 超过预计时间仍未更新，按已经等待的时间估计
+            interval = max(interval, now - history.last_update)
+        total = sum(history.hourly)
+        if total > 0:
+            # 当前小时的更新频率与平均值之比（加一平滑）
+            count = history.hourly[time.localtime(now).tm_hour]
+            weight = (count + 1) / (total / 24 + 1)
+            interval /= min(max(weight, 0.25), 4)
+        return min(max(interval * self.poll_ratio, self.min_interval),
+                   self.max_interval)
+
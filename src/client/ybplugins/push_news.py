@@ -1,7 +1,7 @@
 import asyncio
+import calendar
 import datetime
 import time
-from email.utils import parsedate_tz
 from typing import Any, Callable, Dict, Iterable, List, Tuple, Union
 
 import aiohttp
@@ -11,6 +11,8 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.date import DateTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 
+from . import feed_cursor, feed_reader, http_client
+from .poll_schedule import Poll_schedule
 from .spider import Spiders
 
 
@@ -30,6 +32,16 @@ class News:
         self.scheduler = scheduler
         self.api = bot_api
         self._rssjob = {}
+        # 推送时同时发送的消息数和失败后的重试次数
+        self.send_concurrency = glo_setting.get("news_send_concurrency", 4)
+        self.send_retries = glo_setting.get("news_send_retries", 2)
+        self.last_send_stats: Dict[str, Any] = {}
+        # 自动选择检测时间时，每个资讯源的检查间隔
+        self.schedule = Poll_schedule(
+            glo_setting.get("news_poll_min_minutes", 5) * 60,
+            glo_setting.get("news_poll_max_minutes", 60) * 60,
+        )
+        self._validators: Dict[str, http_client.Validators] = {}
         self.rss = {
             "news_jp_twitter": {
                 "name": "日服推特",
@@ -51,55 +63,65 @@ class News:
                 "pattern": "{title}\n{link}",
             }
         }
+        # 从上次运行保存的位置继续
+        for source, rss_source in self.rss.items():
+            last_id, self._validators[source] = feed_cursor.load(source)
+            if last_id is not None:
+                rss_source["last_id"] = last_id
 
     async def from_rss_async(self, source) -> str:
         rss_source = self.rss[source]
         print(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
               + "检查RSS源：{}".format(rss_source["name"]))
+        validators = self._validators.setdefault(
+            source, http_client.Validators())
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(rss_source["source"], headers=rss_source.get("headers")) as response:
-                    code = response.status
-                    if code != 200:
-                        print("rss源错误：{}，返回值：{}".format(
-                            rss_source["name"], code))
-                        return None
-                    res = await response.text()
+            code, res = await http_client.get_if_modified(
+                rss_source["source"], validators,
+                headers=rss_source.get("headers"))
+            if code == 304:
+                print("rss源未更新：{}，共节省{}KB".format(
+                    rss_source["name"], validators.bytes_saved // 1024))
+                return None
+            if code != 200:
+                print("rss源错误：{}，返回值：{}".format(
+                    rss_source["name"], code))
+                return None
         except aiohttp.client_exceptions.ClientConnectionError:
             print("rss源连接错误："+rss_source["name"])
             return None
         except Exception as e:
             print("未知错误{} {}".format(type(e).__name__, e))
             return None
-        feed = feedparser.parse(res)
-        if feed["bozo"]:
-            print("rss源解析错误："+rss_source["name"])
-            return None
-        if self.news_interval_auto:
-            updated = feed.feed.updated
-            if updated is not None:
-                # 获取rss上次刷新时间
-                lastBuildDate = parsedate_tz(updated)
-                nt = datetime.datetime.fromtimestamp(
-                    time.mktime(lastBuildDate[:-1])
-                    - lastBuildDate[-1]
-                    + 28800)
-                nt += datetime.timedelta(minutes=25)
-                after10min = datetime.datetime.now()+datetime.timedelta(minutes=10)
-                if nt > after10min:
-                    # 执行时间改为上次刷新后25分钟
-                    self.scheduler.reschedule_job(
-                        job_id=source,
-                        jobstore='default',
-                        trigger=DateTrigger(nt),
-                    )
         last_id = rss_source.get("last_id")
-        rss_source["last_id"] = feed["entries"][0]["id"]
+        try:
+            # 只解析上次看到的条目之前的新条目
+            entries = feed_reader.read_entries(
+                res, last_id, feed_reader.pattern_fields(rss_source["pattern"]))
+        except ValueError:
+            feed = feedparser.parse(res)
+            if feed["bozo"]:
+                print("rss源解析错误："+rss_source["name"])
+                return None
+            entries = feed["entries"]
+        if self.news_interval_auto:
+            # 用资讯的发布时间估计更新间隔
+            self.schedule.seed(source, [
+                calendar.timegm(item["published_parsed"])
+                for item in entries
+                if item.get("published_parsed")
+            ])
+        validators.commit()
+        if not entries:
+            feed_cursor.save(source, last_id, validators)
+            return None
+        rss_source["last_id"] = entries[0]["id"]
+        feed_cursor.save(source, rss_source["last_id"], validators)
         if last_id is None:
             print("rss初始化："+rss_source["name"])
             return None
         news_list = list()
-        for item in feed["entries"]:
+        for item in entries:
             if item["id"] == last_id:
                 break
             news_list.append(rss_source["pattern"].format_map(item))
@@ -144,28 +166,6 @@ class News:
                 print("ValueError")
         return news
 
-    async def send_news_async(self) -> List[Dict[str, Any]]:
-        sub_groups = self.setting.get("notify_groups", [])
-        sub_users = self.setting.get("notify_privates", [])
-        if not (sub_groups or sub_users):
-            return None
-        news = await self.get_news_async()
-        sends = []
-        for msg in news:
-            for group in sub_groups:
-                sends.append({
-                    "message_type": "group",
-                    "group_id": group,
-                    "message": msg
-                })
-            for userid in sub_users:
-                sends.append({
-                    "message_type": "private",
-                    "user_id": userid,
-                    "message": msg
-                })
-        return sends
-
     def jobs(self) -> Iterable[Tuple[IntervalTrigger, Callable[[], Iterable[Dict[str, Any]]]]]:
         if not any([self.setting.get(s, True) for s in self.rss.keys()]):
             return tuple()
@@ -180,63 +180,94 @@ class News:
         interval = self.setting.get("news_interval_minutes", 30)
         trigger = IntervalTrigger(
             minutes=interval, start_date=datetime.datetime.now()+datetime.timedelta(seconds=60))
-        job = (trigger, self.send_news_async)
+        job = (trigger, self.send_all_news_async)
         return (job,)
 
+    async def send_all_news_async(self):
+        news = await self.get_news_async()
+        if news:
+            await self.send_news_msg_async(news)
+
     def auto_job(self):
         after_60s = datetime.datetime.now()+datetime.timedelta(seconds=60)
-
-        # spider 为20分钟间隔
-        self.scheduler.add_job(
-            self.send_spider_news_async,
-            trigger=IntervalTrigger(minutes=20, start_date=after_60s),
-            misfire_grace_time=60,
-            coalesce=True,
-            max_instances=1,
-        )
-
-        # 每个 rss 启动第一个任务
         subscribes = [s for s in self.rss.keys() if self.setting.get(s, True)]
+        subscribes += [s for s in self.spiders.sources()
+                       if self.setting.get(s, True)]
         for source in subscribes:
-            self.scheduler.add_job(
-                self.send_rss_news_async,
-                args=(source,),
-                id=source,
-                trigger=DateTrigger(after_60s),
-                misfire_grace_time=60,
-                coalesce=True,
-                max_instances=1,
-            )
-
-    async def send_spider_news_async(self):
-        tasks = [
-            self.spiders[s].get_news_async()
-            for s in self.spiders.sources()
-            if self.setting.get(s, True)
-        ]
-        res = await asyncio.gather(*tasks, return_exceptions=True)
-        await self.send_news_msg_async(res)
+            self._schedule_poll(source, after_60s)
 
-    async def send_rss_news_async(self, source):
-        # 执行时间改为5分钟后
+    def _schedule_poll(self, source: str, run_date: datetime.datetime):
         self.scheduler.add_job(
-            self.send_rss_news_async,
+            self.poll_source_async,
             args=(source,),
             id=source,
             jobstore='default',
+            replace_existing=True,
             misfire_grace_time=60,
             coalesce=True,
             max_instances=1,
-            trigger=DateTrigger(
-                datetime.datetime.now()+datetime.timedelta(minutes=5)
-            ),
+            trigger=DateTrigger(run_date),
         )
-        res = await self.from_rss_async(source)
+
+    async def poll_source_async(self, source: str):
+        """
+        检查一个资讯源，按它的更新频率安排下次检查
+        """
+        res = None
+        try:
+            if source in self.rss:
+                res = await self.from_rss_async(source)
+            else:
+                res = await self.spiders[source].get_news_async()
+        except Exception as e:
+            res = e
+        finally:
+            self.schedule.record(source, isinstance(res, str))
+            delay = self.schedule.next_delay(source)
+            self._schedule_poll(
+                source,
+                datetime.datetime.now()+datetime.timedelta(seconds=delay),
+            )
+            print("{}秒后再次检查：{}".format(int(delay), source))
         await self.send_news_msg_async([res])
 
+    async def _send_one_async(self, message_type: str, target: int,
+                              message: str, semaphore: asyncio.Semaphore,
+                              stats: Dict[str, Any]):
+        for attempt in range(self.send_retries + 1):
+            if attempt:
+                await asyncio.sleep(2 ** attempt)
+            start = time.perf_counter()
+            try:
+                async with semaphore:
+                    if message_type == "group":
+                        await self.api.send_group_msg(
+                            group_id=target,
+                            message=message,
+                        )
+                    else:
+                        await self.api.send_private_msg(
+                            user_id=target,
+                            message=message,
+                        )
+            except Exception as e:
+                error = e
+                continue
+            stats["sent"] += 1
+            stats["latency"].append(time.perf_counter() - start)
+            return
+        stats["failed"] += 1
+        print("资讯推送失败：{} {}，{} {}".format(
+            message_type, target, type(error).__name__, error))
+
     async def send_news_msg_async(self, res: List[Union[Exception, str, None]]):
+        """
+        把资讯同时发送给所有订阅的群和私聊，
+        单个目标发送失败时重试，不影响其他目标
+        """
         sub_groups = self.setting.get("notify_groups", [])
         sub_users = self.setting.get("notify_privates", [])
+        messages = []
         for new_message in res:
             if new_message is None:
                 continue
@@ -244,13 +275,26 @@ class News:
                 print(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
                       + " Exception: " + str(new_message))
                 continue
-            for group in sub_groups:
-                await self.api.send_group_msg(
-                    group_id=group,
-                    message=new_message,
-                )
-            for user in sub_users:
-                await self.api.send_private_msg(
-                    user_id=user,
-                    message=new_message,
-                )
+            messages.append(new_message)
+        if not messages or not (sub_groups or sub_users):
+            return
+        semaphore = asyncio.Semaphore(self.send_concurrency)
+        stats = {"sent": 0, "failed": 0, "latency": []}
+        tasks = []
+        for new_message in messages:
+            tasks.extend(
+                self._send_one_async("group", group, new_message,
+                                     semaphore, stats)
+                for group in sub_groups)
+            tasks.extend(
+                self._send_one_async("private", user, new_message,
+                                     semaphore, stats)
+                for user in sub_users)
+        await asyncio.gather(*tasks)
+        latency = stats.pop("latency")
+        stats["latency_avg"] = sum(latency) / len(latency) if latency else 0.
+        stats["latency_max"] = max(latency, default=0.)
+        self.last_send_stats = stats
+        print("资讯推送：成功{}，失败{}，平均用时{:.0f}ms，最长{:.0f}ms".format(
+            stats["sent"], stats["failed"],
+            stats["latency_avg"] * 1000, stats["latency_max"] * 1000))
@@ -6,8 +6,10 @@ from urllib.parse import urljoin
 from playhouse.shortcuts import model_to_dict
 from quart import Quart, jsonify, redirect, request, session, url_for
 
+from .gacha_pool import save_pool
 from .templating import render_template
 from .ybdata import Clan_group, User
+from .yobot_exceptions import CodingError
 
 _returned_query_fileds = [
     User.qqid,
@@ -196,9 +198,14 @@ class Setting:
                         code=30,
                         message='Invalid payload',
                     )
-                with open(os.path.join(self.setting['dirname'], 'pool3.json'),
-                          'w', encoding='utf-8') as f:
-                    json.dump(new_setting, f, ensure_ascii=False, indent=2)
+                try:
+                    save_pool(os.path.join(self.setting['dirname'], 'pool3.json'),
+                              new_setting)
+                except CodingError as e:
+                    return jsonify(
+                        code=31,
+                        message=e.error_msg,
+                    )
                 return jsonify(
                     code=0,
                     message='success',
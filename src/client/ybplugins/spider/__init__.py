@@ -8,6 +8,8 @@ class Spiders:
             "news_tw_official": Spider_ostw(),
             "news_cn_official": Spider_oscn(),
         }
+        for source, spider in self.spiders.items():
+            spider.load_cursor(source)
 
     def sources(self):
         return self.spiders.keys()
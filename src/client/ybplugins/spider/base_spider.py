@@ -1,12 +1,22 @@
 import abc
+import asyncio
+import importlib.util
 import json
 import time
 from dataclasses import dataclass
-from typing import List, Tuple, Union
+from typing import List, Optional, Tuple, Union
 from urllib.parse import urlparse
 
 import aiohttp
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+
+from .. import feed_cursor, http_client
+
+# 安装了 lxml 时使用 lxml 解析，只检查是否安装，由 BeautifulSoup 导入
+if importlib.util.find_spec("lxml") is not None:
+    html_parser = "lxml"
+else:
+    html_parser = "html.parser"
 
 
 @dataclass
@@ -19,11 +29,34 @@ class Item:
 
 
 class Base_spider:
+    # 只解析需要的标签，为 None 时解析整个页面
+    parse_only: Optional[SoupStrainer] = None
+
     def __init__(self):
         self.url = None
         self.type = None
         self.name = None
+        self.source = None
         self.last_item = None
+        self.validators = http_client.Validators()
+
+    def load_cursor(self, source: str):
+        """
+        读取上次运行时保存的进度
+        """
+        self.source = source
+        last_idx, self.validators = feed_cursor.load(source)
+        if last_idx is not None:
+            self.last_item = Item(idx=last_idx)
+
+    def save_cursor(self):
+        if self.source is None:
+            return
+        feed_cursor.save(
+            self.source,
+            None if self.last_item is None else self.last_item.idx,
+            self.validators,
+        )
 
     async def get_content_async(self) -> Tuple[str, int]:
         headers = {
@@ -37,12 +70,14 @@ class Base_spider:
         print(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
               + "检查咨询源：{}".format(self.name))
         try:
-            async with aiohttp.ClientSession(headers=headers) as session:
-                async with session.get(self.url) as response:
-                    code = response.status
-                    res = await response.text()
-        except aiohttp.client_exceptions.ClientConnectionError:
+            code, res = await http_client.get_if_modified(
+                self.url, self.validators, headers=headers)
+        except (aiohttp.client_exceptions.ClientConnectionError, asyncio.TimeoutError):
             return ("", -1)
+        if code == 304:
+            print("咨询源未更新：{}，共节省{}KB".format(
+                self.name, self.validators.bytes_saved // 1024))
+            return ("", 304)
         return (res, code)
 
     async def get_json_async(self):
@@ -53,6 +88,8 @@ class Base_spider:
             except json.JSONDecodeError:
                 print("咨询获取错误：{}，json解析错误".format(self.name))
                 return None
+        elif code == 304:
+            return None
         else:
             print("咨询获取错误：{}，错误码：{}".format(self.name, code))
             return None
@@ -60,11 +97,16 @@ class Base_spider:
     async def get_soup_async(self) -> Union[BeautifulSoup, None]:
         text, code = await self.get_content_async()
         if code == 200:
-            return BeautifulSoup(text, "html.parser")
+            return self.parse_html(text)
+        elif code == 304:
+            return None
         else:
             print("咨询获取错误：{}，错误码：{}".format(self.name, code))
             return None
 
+    def parse_html(self, text: str) -> BeautifulSoup:
+        return BeautifulSoup(text, html_parser, parse_only=self.parse_only)
+
     @abc.abstractmethod
     def get_items(self, response: Union[BeautifulSoup, dict]) -> List[Item]:
         ...
@@ -79,8 +121,10 @@ class Base_spider:
         items = self.get_items(response)
         if not items:
             return []
+        self.validators.commit()
         last = self.last_item
         self.last_item = items[0]
+        self.save_cursor()
         if last is None:
             print("咨询初始化：{}".format(self.name))
             return []
@@ -1,9 +1,13 @@
 from urllib.parse import urljoin
 
+from bs4 import SoupStrainer
+
 from .base_spider import Base_spider, Item
 
 
 class Spider_ostw(Base_spider):
+    parse_only = SoupStrainer("dd")
+
     def __init__(self):
         super().__init__()
         self.url = "http://www.princessconnect.so-net.tw/news/"
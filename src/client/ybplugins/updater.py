@@ -7,10 +7,11 @@ import sys
 import zipfile
 from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
 
-import aiohttp
 from aiocqhttp.api import Api
 from apscheduler.triggers.cron import CronTrigger
 
+from . import http_client
+
 
 class Updater:
     Passive = True
@@ -52,7 +53,7 @@ class Updater:
         server_available = False
         for url in self.ver["check_url"]:
             try:
-                async with aiohttp.request('GET', url=url) as response:
+                async with http_client.request('GET', url=url) as response:
                     if response.status == 200:
                         res = await response.text()
                         server_available = True
@@ -66,7 +67,8 @@ class Updater:
         if not (force or verinfo["version"] > self.ver["ver_id"]):
             return "已经是最新版本"
         try:
-            async with aiohttp.request('GET', url=verinfo["url"]) as response:
+            async with http_client.request('GET', url=verinfo["url"],
+                                           timeout=http_client.download_timeout) as response:
                 if response.status != 200:
                     return verinfo["url"] + " code: " + str(response.status)
                 content = await response.read()
@@ -106,7 +108,7 @@ class Updater:
         server_available = False
         for url in self.ver["check_url"]:
             try:
-                async with aiohttp.request('GET', url=url) as response:
+                async with http_client.request('GET', url=url) as response:
                     if response.status == 200:
                         res = await response.text()
                         server_available = True
@@ -142,7 +144,7 @@ class Updater:
             return pullcheck
         for url in self.ver["check_url"]:
             try:
-                async with aiohttp.request('GET', url=url) as response:
+                async with http_client.request('GET', url=url) as response:
                     if response.status == 200:
                         res = await response.text()
                         server_available = True
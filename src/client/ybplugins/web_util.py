@@ -1,3 +1,4 @@
+import asyncio
 import os
 import random
 import string
@@ -7,6 +8,7 @@ import aiohttp
 import requests
 from quart import Quart, jsonify, request, send_file, session
 
+from . import http_client
 from .yobot_exceptions import ServerError
 
 _rand_string_chaset = (string.ascii_uppercase +
@@ -29,7 +31,7 @@ def async_cached_func(maxsize=64):
             key = tuple(args)
             if nocache or (key not in cache):
                 if len(cache) >= maxsize:
-                    del cache[cache.keys().next()]
+                    del cache[next(iter(cache))]
                 cache[key] = await fn(*args)
             return cache[key]
         return wrapper
@@ -38,7 +40,7 @@ def async_cached_func(maxsize=64):
 
 @async_cached_func(128)
 async def _ip_location(ip):
-    async with aiohttp.request("GET", url=f'http://freeapi.ipip.net/{ip}') as response:
+    async with http_client.request("GET", url=f'http://freeapi.ipip.net/{ip}') as response:
         if response.status != 200:
             raise ServerError(f'http code {response.status} from ipip.net')
         res = await response.json()
@@ -95,7 +97,7 @@ class WebUtil:
             if name is None:
                 return jsonify(code=400, message='No name specified')
             try:
-                async with aiohttp.request('GET', url='http://api2.yobot.win/getdomain/?name='+name) as response:
+                async with http_client.request('GET', url='http://api2.yobot.win/getdomain/?name='+name) as response:
                     if response.status != 200:
                         raise ServerError(
                             f'http code {response.status} from api2.yobot.win')
@@ -114,14 +116,14 @@ class WebUtil:
                 if filename.endswith('.jpg'):
                     filename = filename[:-4] + '.webp@w400'
                 try:
-                    async with aiohttp.request(
+                    async with http_client.request(
                         "GET",
                         url=f'https://redive.estertion.win/{filename}'
                     ) as response:
                         res = await response.read()
                         if response.status != 200:
                             return res, response.status
-                except aiohttp.ClientError as e:
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
                     print(e)
                     return '404: Not Found', 404
                 if not os.path.exists(os.path.dirname(localfile)):
@@ -1,10 +1,81 @@
+import time
+
 from peewee import *
 from playhouse.migrate import SqliteMigrator, migrate
 
 from .web_util import rand_string
 
-_db = SqliteDatabase(None)
-_version = 21   # 目前版本
+
+class Sql_event:
+    """
+    一条已执行的sql语句
+
+    rows 在读取结果时逐行累加，elapsed 只包含执行耗时
+    """
+    __slots__ = ('sql', 'params', 'elapsed', 'rows')
+
+    def __init__(self, sql, params, elapsed, rows=0):
+        self.sql = sql
+        self.params = params
+        self.elapsed = elapsed
+        self.rows = rows
+
+
+class _Row_counting_cursor:
+    def __init__(self, cursor, event: Sql_event):
+        self._cursor = cursor
+        self._event = event
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._event.rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._event.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._event.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._event.rows += 1
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _Observed_database(SqliteDatabase):
+    """
+    每执行一条sql，依次调用 sql_hooks 中的函数 hook(event: Sql_event)
+
+    没有hook时不做任何额外工作
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sql_hooks = []
+
+    def execute_sql(self, sql, params=None, *args, **kwargs):
+        if not self.sql_hooks:
+            return super().execute_sql(sql, params, *args, **kwargs)
+        start = time.perf_counter()
+        cursor = super().execute_sql(sql, params, *args, **kwargs)
+        event = Sql_event(sql, params, time.perf_counter() - start,
+                          max(cursor.rowcount, 0))
+        for hook in self.sql_hooks:
+            hook(event)
+        return _Row_counting_cursor(cursor, event)
+
+
+_db = _Observed_database(None)
+_version = 25   # 目前版本
 
 MAX_TRY_TIMES = 3
 
@@ -189,6 +260,47 @@ class User_box(_BaseModel):
         primary_key = CompositeKey('qqid', 'chid')
 
 
+class Gacha_user(_BaseModel):
+    qqid = BigIntegerField(primary_key=True)
+    times = IntegerField(default=0)
+    last_day = CharField(max_length=4, default='')
+    day_times = IntegerField(default=0)
+
+
+class Gacha_collection(_BaseModel):
+    qqid = BigIntegerField()
+    character = CharField(max_length=64)
+    count = IntegerField(default=0)
+
+    class Meta:
+        primary_key = CompositeKey('qqid', 'character')
+
+
+class Jjc_defense(_BaseModel):
+    key = CharField(max_length=128, primary_key=True)
+    source = CharField(max_length=16)
+    region = IntegerField()
+    result = TextField()
+    update_time = BigIntegerField()
+
+
+class Jjc_defense_char(_BaseModel):
+    char_id = IntegerField()
+    defense = CharField(max_length=128)
+
+    class Meta:
+        primary_key = CompositeKey('char_id', 'defense')
+
+
+class Feed_cursor(_BaseModel):
+    source = CharField(max_length=64, primary_key=True)
+    last_id = TextField(null=True)
+    etag = TextField(null=True)
+    last_modified = TextField(null=True)
+    length = IntegerField(default=0)
+    update_time = BigIntegerField(default=0)
+
+
 class DB_schema(_BaseModel):
     key = CharField(max_length=64, primary_key=True)
     value = TextField()
@@ -222,6 +334,11 @@ def init(sqlite_filename):
         Clan_subscribe_layv.create_table()
         Character.create_table()
         User_box.create_table()
+        Gacha_user.create_table()
+        Gacha_collection.create_table()
+        Jjc_defense.create_table()
+        Jjc_defense_char.create_table()
+        Feed_cursor.create_table()
         old_version = _version
     if old_version > _version:
         print('数据库版本高于程序版本，请升级yobot')
@@ -365,5 +482,13 @@ def db_upgrade(old_version):
             migrator.add_column('clan_challenge', 'is_used',
                                 BooleanField(default=False)),
         )
-        
+    if old_version < 22:
+        Gacha_user.create_table()
+        Gacha_collection.create_table()
+    if old_version < 24:
+        Jjc_defense.create_table()
+        Jjc_defense_char.create_table()
+    if old_version < 25:
+        Feed_cursor.create_table()
+
     DB_schema.replace(key='version', value=str(_version)).execute()
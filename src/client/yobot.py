@@ -13,6 +13,7 @@ from urllib.parse import urljoin
 import requests
 from aiocqhttp.api import Api
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.interval import IntervalTrigger
 from opencc import OpenCC
 from quart import Quart, send_file
 
@@ -20,12 +21,20 @@ if __package__:
     from .ybplugins import (calender, clan_battle, gacha, homepage,
                             jjc_consult, login, marionette, push_news, settings,
                             switcher, templating, updater, web_util, ybdata,
-                            yobot_msg, custom, miner, group_leave)
+                            yobot_msg, custom, miner, group_leave, perf)
+    from .ybplugins import http_client
+    from .ybplugins.output_store import Output_store
+    from .ybplugins.page_cache import Page_cache
+    from .ybplugins.perf import query_budget, tracing
 else:
     from ybplugins import (calender, clan_battle, gacha, homepage,
                            jjc_consult, login, marionette, push_news, settings,
                            switcher, templating, updater, web_util, ybdata,
-                           yobot_msg, custom, miner, group_leave)
+                           yobot_msg, custom, miner, group_leave, perf)
+    from ybplugins import http_client
+    from ybplugins.output_store import Output_store
+    from ybplugins.page_cache import Page_cache
+    from ybplugins.perf import query_budget, tracing
 
 # 本项目构建的框架非常粗糙，不建议各位把时间浪费本项目上
 # 如果想开发自己的机器人，建议直接使用 nonebot 框架
@@ -163,6 +172,10 @@ class Yobot:
             return await send_file(
                 os.path.join(os.path.dirname(__file__), "public", "static", filename))
 
+        # shared http client
+        quart_app.before_serving(http_client.start)
+        quart_app.after_serving(http_client.close)
+
         # add route for output files
         if not os.path.exists(os.path.join(dirname, "output")):
             os.mkdir(os.path.join(dirname, "output"))
@@ -174,6 +187,39 @@ class Yobot:
         async def yobot_output(filename):
             return await send_file(os.path.join(dirname, "output", filename))
 
+        # add route for generated pages
+        self.output_store = Output_store(
+            os.path.join(dirname, "output"),
+            max_bytes=self.glo_setting.get("output_store_mb", 200) * 2**20,
+            max_age=self.glo_setting.get("output_store_days", 7) * 86400,
+        )
+        scheduler.add_job(
+            self.output_store.gc,
+            trigger=IntervalTrigger(hours=1),
+            misfire_grace_time=600,
+            coalesce=True,
+            max_instances=1,
+        )
+        self.page_cache = Page_cache(
+            max_bytes=self.glo_setting.get("page_cache_mb", 32) * 2**20,
+            ttl=self.glo_setting.get("page_cache_hours", 6) * 3600,
+            store=self.output_store,
+        )
+
+        @quart_app.route(
+            urljoin(self.glo_setting["public_basepath"],
+                    "page/<key>.html"),
+            methods=["GET"])
+        async def yobot_page(key):
+            page = self.page_cache.get(key)
+            if page is None:
+                return await templating.render_template(
+                    '404.html', item='页面'), 404
+            return page, 200, {
+                'Content-Type': 'text/html; charset=utf-8',
+                'Cache-Control': 'private, max-age=3600',
+            }
+
         # openCC
         self.ccs2t = OpenCC(self.glo_setting.get("zht_out_style", "s2t"))
         self.cct2s = OpenCC("t2s")
@@ -193,6 +239,7 @@ class Yobot:
             "bot_api": bot_api,
             "scheduler": scheduler,
             "app": quart_app,
+            "page_cache": self.page_cache,
         }
 
         # load plugins
@@ -210,6 +257,7 @@ class Yobot:
             settings.Setting(**kwargs),
             web_util.WebUtil(**kwargs),
             clan_battle.ClanBattle(**kwargs),
+            perf.Monitor(**kwargs),
         ]
         self.plug_passive = [p for p in plug_all if p.Passive]
         self.plug_active = [p for p in plug_all if p.Active]
@@ -234,35 +282,40 @@ class Yobot:
         receive a message and return a reply
         '''
         # prefix
-        if self.glo_setting.get("preffix_on", False):
-            preffix = self.glo_setting.get("preffix_string", "")
-            if not msg["raw_message"].startswith(preffix):
-                return None
-            else:
-                msg["raw_message"] = (
-                    msg["raw_message"][len(preffix):])
+        with tracing.span('prefix'):
+            if self.glo_setting.get("preffix_on", False):
+                preffix = self.glo_setting.get("preffix_string", "")
+                if not msg["raw_message"].startswith(preffix):
+                    return None
+                else:
+                    msg["raw_message"] = (
+                        msg["raw_message"][len(preffix):])
 
         # black-list
-        if msg["sender"]["user_id"] in self.black_list:
-            return None
-        if msg["message_type"] == "group":
-            if self.glo_setting["white_list_mode"]:
-                if msg["group_id"] not in self.white_list_group:
-                    return None
-            else:
-                if msg["group_id"] in self.black_list_group:
-                    return None
+        with tracing.span('black-list'):
+            if msg["sender"]["user_id"] in self.black_list:
+                return None
+            if msg["message_type"] == "group":
+                if self.glo_setting["white_list_mode"]:
+                    if msg["group_id"] not in self.white_list_group:
+                        return None
+                else:
+                    if msg["group_id"] in self.black_list_group:
+                        return None
 
         # zht-zhs convertion
         if self.glo_setting.get("zht_in", False):
-            msg["raw_message"] = self.cct2s.convert(msg["raw_message"])
+            with tracing.span('zht-zhs'):
+                msg["raw_message"] = self.cct2s.convert(msg["raw_message"])
         if msg["sender"].get("card", "") == "":
             msg["sender"]["card"] = msg["sender"].get("nickname", "无法获取昵称")
 
         # run new
         reply_msg = None
         for plug in self.plug_new:
-            ret = await plug.execute_async(msg)
+            name = type(plug).__name__
+            with query_budget.operation(name), tracing.span('execute: '+name):
+                ret = await plug.execute_async(msg)
             if ret is None:
                 continue
             elif isinstance(ret, bool):
@@ -278,21 +331,26 @@ class Yobot:
 
         if reply_msg:
             if self.glo_setting.get("zht_out", False):
-                reply_msg = self.ccs2t.convert(reply_msg)
+                with tracing.span('zhs-zht'):
+                    reply_msg = self.ccs2t.convert(reply_msg)
             return reply_msg
 
         # run
         replys = []
         for pitem in self.plug_passive:
+            name = type(pitem).__name__
             if hasattr(pitem, 'match'):
-                func_num = pitem.match(msg["raw_message"])
+                with tracing.span('match: '+name):
+                    func_num = pitem.match(msg["raw_message"])
             else:
                 func_num = True
             if func_num:
-                if hasattr(pitem, "execute_async"):
-                    res = await pitem.execute_async(func_num, msg)
-                else:
-                    res = pitem.execute(func_num, msg)
+                name = '{}.{}'.format(name, func_num)
+                with query_budget.operation(name), tracing.span('execute: '+name):
+                    if hasattr(pitem, "execute_async"):
+                        res = await pitem.execute_async(func_num, msg)
+                    else:
+                        res = pitem.execute(func_num, msg)
                 if res is None:
                     continue
                 if isinstance(res, str):
@@ -308,7 +366,8 @@ class Yobot:
 
         # zhs-zht convertion
         if self.glo_setting.get("zht_out", False):
-            reply_msg = self.ccs2t.convert(reply_msg)
+            with tracing.span('zhs-zht'):
+                reply_msg = self.ccs2t.convert(reply_msg)
 
         return reply_msg
 